@@ -10,7 +10,6 @@ import os
 import errno
 import random
 import string
-from SampleNetworkClient import *
 
 class SmartNetworkThermometer (threading.Thread) :
     open_cmds = ["AUTH", "LOGOUT"]
@@ -0,0 +1,200 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+import cryptography.fernet
+import numpy as np
+
+import infinc
+from clientsession import ThermometerSession
+from ratelimit import DEFAULT_RATE_LIMITS
+from thermometer import SmartNetworkThermometer, UPDATE_PERIOD
+
+OPERATIONS = ["AUTH", "GET_TEMP", "LOGOUT"]
+
+
+def parseMix(text):
+    # "GET_TEMP=8,AUTH=1,LOGOUT=1" -> {"GET_TEMP": 8.0, "AUTH": 1.0, "LOGOUT": 1.0}
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in OPERATIONS:
+            raise ValueError("unknown operation %s" % name)
+        mix[name] = float(weight)
+    return mix
+
+
+def serveDevices(ports, password, key, period, useAsyncio, rateLimits, conn):
+    # Runs in its own process so its CPU time is the server's alone
+    body = infinc.Human(mass=8, length=1.68, temperature=36 + 273)
+    thermometers = [SmartNetworkThermometer(body, period, port, password, key, useAsyncio=useAsyncio,
+                                            rateLimits=rateLimits) for port in ports]
+    for thermometer in thermometers:
+        thermometer.start()
+    time.sleep(0.1)  # let every thread bind its socket
+    conn.send("ready")
+    conn.recv()  # clients are starting
+    cpu = time.process_time()
+    conn.recv()  # clients are done
+    stats = {}
+    for thermometer in thermometers:
+        for name, n in thermometer.stats.counters.items():
+            stats[name] = stats.get(name, 0) + n
+    conn.send((time.process_time() - cpu, stats))
+
+
+def runClient(port, password, key, wire, mix, duration, timeout, seed, queue):
+    # Drives one thermometer with a random mix of operations until duration is up
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    latencies = {name: [] for name in OPERATIONS}
+    lost = 0
+    session = ThermometerSession(port, password, key, timeout=timeout, retries=0, wire=wire)
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        name = rng.choices(names, weights)[0]
+        if name == "LOGOUT" and session.token is None:
+            name = "AUTH"
+        if name == "GET_TEMP" and session.token is None:
+            name = "AUTH"  # can't read without logging in, and counting it as lost would lie
+        start = time.perf_counter()
+        try:
+            if name == "AUTH":
+                session.authenticate()
+            elif name == "GET_TEMP":
+                if session.request("GET_TEMP", protected=True) == "Bad Token":
+                    session.token = None
+            else:
+                session.logout()  # no reply, this only times the send
+        except TimeoutError:
+            lost += 1
+            if name == "AUTH":
+                session.token = None
+            continue
+        latencies[name].append(time.perf_counter() - start)
+    session.close()
+    queue.put((latencies, lost))
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p99": 0.0}
+    p50, p99 = np.percentile(samples, [50, 99])
+    return {"count": len(samples), "p50": float(p50), "p99": float(p99)}
+
+
+def runBenchmark(devices=1, clients=4, duration=5.0, mix=None, wire="fernet", useAsyncio=False,
+                 port=24000, timeout=0.5, period=UPDATE_PERIOD, rateLimits=None):
+    """Starts local thermometers in a separate process, drives them with
+    clients concurrent client processes for duration seconds and returns the
+    throughput, latency percentiles, loss and server CPU use as a dict.
+
+    All clients share 127.0.0.1, so the servers' per address rate limits are
+    off unless rateLimits is given."""
+    mix = mix or {"AUTH": 1, "GET_TEMP": 8, "LOGOUT": 1}
+    key = cryptography.fernet.Fernet.generate_key().decode("utf-8")
+    password = "bench%d" % random.getrandbits(32)
+    ports = [port + i for i in range(devices)]
+
+    conn, serverConn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serveDevices,
+                                     args=(ports, password, key, period, useAsyncio, rateLimits, serverConn))
+    server.start()
+    conn.recv()
+
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=runClient, args=(
+        ports[i % devices], password, key, wire, mix, duration, timeout, i, queue)) for i in range(clients)]
+    conn.send("start")
+    wallStart = time.monotonic()
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for worker in workers]
+    wall = time.monotonic() - wallStart
+    for worker in workers:
+        worker.join()
+    conn.send("stop")
+    cpu, serverStats = conn.recv()
+    server.join()
+
+    latencies = {name: [] for name in OPERATIONS}
+    lost = 0
+    for clientLatencies, clientLost in results:
+        lost += clientLost
+        for name, samples in clientLatencies.items():
+            latencies[name].extend(samples)
+    done = sum(len(samples) for samples in latencies.values())
+    requests = done + lost - len(latencies["LOGOUT"])  # LOGOUT has no reply to lose
+    return {
+        "config": {"devices": devices, "clients": clients, "duration": duration, "mix": mix,
+                   "wire": wire, "asyncio": useAsyncio, "period": period, "rateLimits": rateLimits is not None},
+        "throughput": done / wall,
+        "latency": {name: percentiles(samples) for name, samples in latencies.items()},
+        "all": percentiles([s for name in ("AUTH", "GET_TEMP") for s in latencies[name]]),
+        "loss": lost / requests if requests else 0.0,
+        "serverCpu": cpu,
+        "serverCpuShare": cpu / wall,
+        "serverStats": serverStats,
+    }
+
+
+def formatReport(report, baseline=None):
+    # one line per figure, with the change against baseline when given
+    def line(label, value, old, unit, scale=1.0):
+        text = "%-22s %12.2f %s" % (label, value * scale, unit)
+        if old:
+            text += "  (%+.1f%%)" % ((value - old) / old * 100)
+        return text
+
+    def get(path):
+        value = baseline
+        for part in path:
+            if value is None:
+                return None
+            value = value.get(part)
+        return value
+
+    lines = [line("throughput", report["throughput"], get(["throughput"]), "ops/s")]
+    for name in ["all"] + OPERATIONS:
+        stats = report["latency"][name] if name != "all" else report["all"]
+        if not stats["count"]:
+            continue
+        path = ["latency", name] if name != "all" else ["all"]
+        lines.append(line("%s p50" % name, stats["p50"], get(path + ["p50"]), "us", 1e6))
+        lines.append(line("%s p99" % name, stats["p99"], get(path + ["p99"]), "us", 1e6))
+    lines.append(line("loss", report["loss"], None, "%", 100))
+    lines.append(line("server cpu", report["serverCpuShare"], get(["serverCpuShare"]), "% of one core", 100))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Local load generator for the thermometer protocol.")
+    argParser.add_argument("--devices", type=int, default=1, help="thermometers to start")
+    argParser.add_argument("--clients", type=int, default=4, help="concurrent client processes")
+    argParser.add_argument("--duration", type=float, default=5, help="seconds to run")
+    argParser.add_argument("--mix", default="AUTH=1,GET_TEMP=8,LOGOUT=1", help="operation weights")
+    argParser.add_argument("--wire", default="fernet", help="fernet, chacha20 or aesgcm")
+    argParser.add_argument("--asyncio", action="store_true", help="serve with asyncio instead of polling")
+    argParser.add_argument("--period", type=float, default=UPDATE_PERIOD,
+                           help="thermometer update period, how often readings are refreshed and pushed")
+    argParser.add_argument("--port", type=int, default=24000, help="first port, device i is on port + i")
+    argParser.add_argument("--timeout", type=float, default=0.5, help="seconds before a request counts as lost")
+    argParser.add_argument("--rate-limit", action="store_true", help="keep the servers' default rate limits")
+    argParser.add_argument("--save", help="write the report as JSON to this file")
+    argParser.add_argument("--baseline", help="compare against a report saved with --save")
+    args = argParser.parse_args()
+
+    report = runBenchmark(args.devices, args.clients, args.duration, parseMix(args.mix), args.wire,
+                          args.asyncio, args.port, args.timeout, args.period,
+                          DEFAULT_RATE_LIMITS if args.rate_limit else None)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(formatReport(report, baseline))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
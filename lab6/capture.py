@@ -0,0 +1,296 @@
+import argparse
+import collections
+import configparser
+import logging
+import selectors
+import socket
+import struct
+import time
+
+import cryptography.exceptions
+import cryptography.fernet
+
+import aead
+from proxy import UdpRelay, parseRoute
+from serverstats import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+MAX_DATAGRAM = 65535
+HEADER = struct.Struct("<4sB3x")  # magic, version
+RECORD = struct.Struct("<dBIHI")  # wall time, direction, flow id, upstream port, length
+MAGIC = b"TTRC"
+UP, DOWN = 0, 1
+
+
+class TraceWriter:
+    """Writes the datagrams a UdpRelay relays to a compact trace file.
+
+    Each datagram is stored as it was on the wire (still encrypted) after a
+    19 byte record header. Use it as a relay tap: relay.addTap(writer).
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, 1))
+        self.flowIds = {}  # Flow -> id, in order of first datagram
+        self.records = 0
+
+    def __call__(self, now, direction, flow, data):
+        flowId = self.flowIds.setdefault(flow, len(self.flowIds))
+        self.file.write(RECORD.pack(now, UP if direction == "up" else DOWN, flowId, flow.upstream[1], len(data)))
+        self.file.write(data)
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+
+
+class TraceReader:
+    """Iterates over a trace as (time, direction, flow id, upstream port, data)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != 1:
+            raise ValueError("%s is not a thermometer trace" % path)
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size)
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return  # end of file, or a record cut short by a crash
+                now, direction, flowId, port, length = RECORD.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                yield now, direction, flowId, port, data
+
+
+class TokenRewriter:
+    """Swaps the session tokens in recorded requests for the ones the live
+    server hands out, so a replay is served like the original traffic
+    instead of being answered with Bad Token.
+
+    Needs the Fernet key. The tokens each recorded flow was issued are read
+    from the trace first; the n-th token the live server issues on a flow
+    then stands in for the n-th recorded one.
+    """
+
+    def __init__(self, key, trace):
+        self.key = key
+        self.crypto = cryptography.fernet.Fernet(key)
+        self.recorded = collections.defaultdict(list)  # flow id -> tokens in issue order
+        self.issued = collections.Counter()  # flow id -> live tokens seen
+        self.mapping = {}  # recorded token -> live token
+        self.channels = {}  # (token, version) -> aead.AeadChannel
+        for now, direction, flowId, port, data in trace:
+            token = self.tokenReply(data) if direction == DOWN else None
+            if token:
+                self.recorded[flowId].append(token)
+        self.known = {token for tokens in self.recorded.values() for token in tokens}
+
+    def tokenReply(self, data):
+        # AUTH replies are the only ones without a trailing newline
+        if aead.isFrame(data):
+            return None
+        try:
+            msg = self.crypto.decrypt(data).decode("utf-8")
+        except (cryptography.fernet.InvalidToken, UnicodeDecodeError):
+            return None
+        return msg if msg and not msg.endswith("\n") and " " not in msg else None
+
+    def learn(self, flowId, data):
+        # called with every live reply
+        token = self.tokenReply(data)
+        if token is None:
+            return
+        n = self.issued[flowId]
+        self.issued[flowId] += 1
+        if n < len(self.recorded[flowId]):
+            self.mapping[self.recorded[flowId][n]] = token
+
+    def requestToken(self, data):
+        # the recorded token a request uses, or None
+        if aead.isRequestFrame(data):
+            return aead.frameToken(data)
+        try:
+            msg = self.crypto.decrypt(data).decode("utf-8")
+        except (cryptography.fernet.InvalidToken, UnicodeDecodeError):
+            return None
+        if msg.startswith("LOGOUT "):
+            return msg[len("LOGOUT "):].strip()
+        semi = msg.find(";")
+        return msg[:semi] if semi != -1 and " " not in msg[:semi] else None
+
+    def waiting(self, data):
+        # True if the request needs a live token that hasn't been issued yet
+        token = self.requestToken(data)
+        return token in self.known and token not in self.mapping
+
+    def getChannel(self, token, version):
+        channel = self.channels.get((token, version))
+        if channel is None:
+            channel = self.channels[(token, version)] = aead.AeadChannel(self.key, token, version)
+        return channel
+
+    def rewrite(self, data):
+        old = self.requestToken(data)
+        new = self.mapping.get(old)
+        if new is None:
+            return data
+        if aead.isRequestFrame(data):
+            try:
+                plaintext = self.getChannel(old, data[0]).openRequest(data)
+            except (cryptography.exceptions.InvalidTag, ValueError):
+                return data
+            return self.getChannel(new, data[0]).sealRequest(plaintext)
+        msg = self.crypto.decrypt(data).decode("utf-8")
+        return self.crypto.encrypt(msg.replace(old, new, 1).encode("utf-8"))
+
+
+class TraceReplayer:
+    """Resends the client side of a trace and times the replies.
+
+    speed scales the recorded gaps (10 replays ten times faster), None sends
+    as fast as possible. Each recorded flow gets its own socket so the server
+    sees as many clients as were recorded. targets maps a recorded upstream
+    port to the (host, port) to send to; unmapped ports go to 127.0.0.1 on
+    the same port. With a rewriter, a request that needs a token the live
+    server hasn't issued yet waits up to timeout for it.
+    """
+
+    def __init__(self, path, targets=None, speed=1.0, timeout=1.0, rewriter=None):
+        self.trace = TraceReader(path)
+        self.targets = targets or {}
+        self.speed = speed
+        self.timeout = timeout
+        self.rewriter = rewriter
+        self.selector = selectors.DefaultSelector()
+        self.sockets = {}  # flow id -> socket
+        self.pending = collections.defaultdict(collections.deque)  # flow id -> send times
+        self.latency = LatencyHistogram()
+        self.counters = collections.Counter()
+
+    def getSocket(self, flowId, port):
+        sock = self.sockets.get(flowId)
+        if sock is None:
+            sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.connect(self.targets.get(port, ("127.0.0.1", port)))
+            self.sockets[flowId] = sock
+            self.selector.register(sock, selectors.EVENT_READ, flowId)
+        return sock
+
+    def receive(self, timeout):
+        # handles every reply that arrives within timeout
+        for key, events in self.selector.select(max(timeout, 0)):
+            flowId = key.data
+            try:
+                data = key.fileobj.recv(MAX_DATAGRAM)
+            except (BlockingIOError, ConnectionRefusedError):
+                self.counters["refused"] += 1
+                continue
+            self.counters["received"] += 1
+            if self.pending[flowId]:
+                self.latency.observe(time.perf_counter() - self.pending[flowId].popleft())
+            else:
+                self.counters["unsolicited"] += 1
+            if self.rewriter:
+                self.rewriter.learn(flowId, data)
+
+    def send(self, flowId, port, data):
+        if self.rewriter:
+            deadline = time.monotonic() + self.timeout
+            while self.rewriter.waiting(data) and time.monotonic() < deadline:
+                self.receive(deadline - time.monotonic())
+            rewritten = self.rewriter.rewrite(data)
+            if rewritten is not data:
+                self.counters["rewritten"] += 1
+            data = rewritten
+        try:
+            self.getSocket(flowId, port).send(data)
+        except (BlockingIOError, ConnectionRefusedError):
+            self.counters["send_failed"] += 1
+            return
+        self.pending[flowId].append(time.perf_counter())
+        self.counters["sent"] += 1
+
+    def replay(self):
+        """Replays the trace and returns counters, latency and timing as a dict."""
+        start = time.monotonic()
+        first = last = None
+        for now, direction, flowId, port, data in self.trace:
+            if direction != UP:
+                continue
+            if first is None:
+                first = now
+            last = now
+            if self.speed:
+                wait = start + (now - first) / self.speed - time.monotonic()
+                while wait > 0:
+                    self.receive(wait)
+                    wait = start + (now - first) / self.speed - time.monotonic()
+            self.receive(0)
+            self.send(flowId, port, data)
+        elapsed = time.monotonic() - start
+        # collect the stragglers
+        deadline = time.monotonic() + self.timeout
+        while any(self.pending.values()) and time.monotonic() < deadline:
+            self.receive(deadline - time.monotonic())
+        for sock in self.sockets.values():
+            sock.close()
+        result = dict(self.counters)
+        result["lost"] = sum(len(p) for p in self.pending.values())
+        result["flows"] = len(self.sockets)
+        result["recorded_seconds"] = (last - first) if first is not None else 0.0
+        result["replay_seconds"] = elapsed  # first to last send, like recorded_seconds
+        result["latency"] = self.latency.summary()
+        return result
+
+
+def readKey(path="config.ini"):
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    parser.read(filenames=path)
+    return parser['configs']['key']
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Record thermometer traffic through the relay and replay it.")
+    commands = argParser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="relay traffic and save it to a trace")
+    record.add_argument("output", help="trace file to write")
+    record.add_argument("--route", action="append", type=parseRoute,
+                        help="localport=host:port, repeat for more upstreams (default 23459=127.0.0.1:23456)")
+    record.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    replay = commands.add_parser("replay", help="resend a trace and time the replies")
+    replay.add_argument("trace", help="trace file to read")
+    replay.add_argument("--speed", default="1", help="1, 10, ... times the recorded rate, or max")
+    replay.add_argument("--target", action="append", type=parseRoute, default=[],
+                        help="recordedport=host:port, default is the recorded port on 127.0.0.1")
+    replay.add_argument("--timeout", type=float, default=1.0, help="seconds to wait for replies")
+    replay.add_argument("--rewrite-tokens", action="store_true",
+                        help="use the key in config.ini to swap recorded tokens for live ones")
+    args = argParser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "record":
+        relay = UdpRelay(dict(args.route or [parseRoute("23459=127.0.0.1:23456")]), args.host)
+        writer = TraceWriter(args.output)
+        relay.addTap(writer)
+        try:
+            relay.run()  # in this thread, so Ctrl-C stops it between datagrams
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
+            logger.info("wrote %d datagrams to %s", writer.records, args.output)
+    else:
+        rewriter = TokenRewriter(readKey(), TraceReader(args.trace)) if args.rewrite_tokens else None
+        speed = None if args.speed == "max" else float(args.speed)
+        replayer = TraceReplayer(args.trace, dict(args.target), speed, args.timeout, rewriter)
+        for name, value in replayer.replay().items():
+            print("%-18s %s" % (name, value))
@@ -0,0 +1,192 @@
+import collections
+import hashlib
+import socket
+import time
+
+import cryptography.exceptions
+import cryptography.fernet
+
+import aead
+
+MAX_DATAGRAM = 65535  # batched replies can be larger than a single reading
+HISTORY_LIMIT = 1000  # samples per GET_HISTORY reply, same as the server
+
+
+class ThermometerSession:
+    """A long lived connection to one SmartNetworkThermometer.
+
+    Keeps a single UDP socket for the life of the session instead of opening
+    one per request, retries requests that time out and logs in again when the
+    server no longer accepts the token (e.g. after it expired or was evicted).
+
+    After subscribe() the server pushes readings on its own; use receive() to
+    read them. Pushes that arrive while waiting for a reply are kept for
+    receive() rather than mistaken for the reply.
+
+    wire selects how protected commands are encrypted: "fernet" (the default)
+    or one of the compact AEAD modes in aead.WIRE_MODES.
+    """
+
+    def __init__(self, port, password, key, host="127.0.0.1", timeout=1.0, retries=3, wire="fernet"):
+        if wire != "fernet" and wire not in aead.WIRE_MODES:
+            raise ValueError("unknown wire mode %s" % wire)
+        self.address = (host, port)
+        self.key = key
+        self.wire = wire
+        self.channel = None  # AEAD channel for the current token
+        self.crypto = cryptography.fernet.Fernet(key=key)
+        self.hashedPassword = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        self.timeout = timeout
+        self.retries = retries
+        self.token = None
+        self.pushed = collections.deque()  # readings pushed by a subscription
+        self.subscription = None  # (interval, deadband, renew at)
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.socket.connect(self.address)  # only accept replies from this server
+        self.socket.settimeout(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def decrypt(self, data):
+        # Returns the stripped message, or None if it was a pushed reading
+        if aead.isFrame(data):
+            if self.channel is None:
+                return None
+            try:
+                msg = self.channel.openReply(data).decode("utf-8").strip()
+            except (cryptography.exceptions.InvalidTag, ValueError):
+                return None  # meant for an older session, or corrupted
+        else:
+            msg = self.crypto.decrypt(data).decode("utf-8").strip()
+        if msg.startswith("PUSH "):
+            self.pushed.append(float(msg[5:]))
+            return None
+        return msg
+
+    def drain(self):
+        # throw away late replies to requests that already timed out so they
+        # aren't mistaken for the answer to the next one
+        self.socket.setblocking(False)
+        try:
+            while True:
+                self.decrypt(self.socket.recv(MAX_DATAGRAM))
+        except (BlockingIOError, ConnectionRefusedError):
+            pass
+        finally:
+            self.socket.settimeout(self.timeout)
+
+    def encode(self, msg, protected=False):
+        # Protected requests are just the commands, the token is added here
+        if protected and self.channel is not None:
+            return self.channel.sealRequest(msg.encode("utf-8"))
+        if protected:
+            return self.crypto.encrypt(("%s;%s" % (self.token, msg)).encode("utf-8"))
+        return self.crypto.encrypt(msg.encode("utf-8"))
+
+    def request(self, msg, protected=False):
+        # Sends an encrypted request and returns the decrypted, stripped reply
+        data = self.encode(msg, protected)
+        for attempt in range(self.retries + 1):
+            self.drain()
+            self.socket.send(data)
+            deadline = time.monotonic() + self.timeout
+            try:
+                while True:
+                    self.socket.settimeout(max(deadline - time.monotonic(), 0.001))
+                    reply = self.decrypt(self.socket.recv(MAX_DATAGRAM))
+                    if reply is not None:
+                        return reply
+            except (socket.timeout, ConnectionRefusedError):
+                continue
+            finally:
+                self.socket.settimeout(self.timeout)
+        raise TimeoutError("no reply from %s:%d" % self.address)
+
+    def authenticate(self):
+        self.token = self.request("AUTH %s" % self.hashedPassword)
+        if self.wire != "fernet":
+            self.channel = aead.AeadChannel(self.key, self.token, aead.WIRE_MODES[self.wire])
+        return self.token
+
+    def command(self, cmds):
+        # Runs protected commands, logging in first if needed
+        if self.token is None:
+            self.authenticate()
+        reply = self.request(cmds, protected=True)
+        if reply == "Bad Token":
+            self.authenticate()
+            reply = self.request(cmds, protected=True)
+        return reply
+
+    def batch(self, cmds):
+        # Runs a list of commands in one round trip, returns one reply per command
+        return self.command("BATCH;" + ";".join(cmds)).split("\n")
+
+    def getTemperature(self):
+        return float(self.command("GET_TEMP"))
+
+    def getTemperatures(self, ports):
+        # Reads several devices at once through a gateway hub
+        return [float(r) for r in self.batch(["GET_TEMP:%d" % p for p in ports])]
+
+    def getHistory(self, since=0.0):
+        # Returns [(timestamp, temperature), ...] newer than since, oldest first
+        samples = []
+        while True:
+            reply = self.command("GET_HISTORY:%r" % since)  # exact, so no sample comes twice
+            if not reply:
+                return samples
+            fields = reply.split(" ")
+            start = float(fields[0])
+            page = [(start + float(t), float(v)) for t, v in (f.split(",") for f in fields[1:])]
+            samples.extend(page)
+            since = page[-1][0]
+            if len(page) < HISTORY_LIMIT:
+                return samples
+
+    def subscribe(self, interval, deadband=0.0):
+        # Asks the server to push readings at most every interval seconds and,
+        # if deadband is set, only when they change by more than deadband degK
+        reply = self.command("SUBSCRIBE:%f:%f" % (interval, deadband))
+        if reply != "OK":
+            raise ValueError("subscribe failed: %s" % reply)
+        # renew well before the server side lease runs out
+        self.subscription = (interval, deadband, time.monotonic() + 20)
+
+    def unsubscribe(self):
+        self.subscription = None
+        self.command("UNSUBSCRIBE")
+
+    def receive(self, timeout=None):
+        # Returns the next pushed reading, or None if none came within timeout
+        if self.subscription is not None and time.monotonic() > self.subscription[2]:
+            self.subscribe(self.subscription[0], self.subscription[1])
+        if self.pushed:
+            return self.pushed.popleft()
+        self.socket.settimeout(self.timeout if timeout is None else timeout)
+        try:
+            while not self.pushed:
+                self.decrypt(self.socket.recv(MAX_DATAGRAM))
+        except (socket.timeout, ConnectionRefusedError):
+            return None
+        finally:
+            self.socket.settimeout(self.timeout)
+        return self.pushed.popleft()
+
+    def logout(self):
+        self.subscription = None
+        if self.token is not None:
+            self.socket.send(self.crypto.encrypt(("LOGOUT %s" % self.token).encode("utf-8")))
+            self.token = None
+            self.channel = None
+
+    def close(self):
+        try:
+            self.logout()
+        except OSError:
+            pass
+        self.socket.close()
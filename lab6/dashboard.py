@@ -0,0 +1,62 @@
+import time
+
+import matplotlib.animation as animation
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+class TemperaturePlot:
+    """Live plot of infant and incubator temperatures.
+
+    Both lines are updated by one blitted FuncAnimation from preallocated
+    numpy buffers holding the last window samples. The x axis is labelled in
+    seconds before now, so the tick labels never change; the wall clock time
+    is a small blitted text instead and the date title is only redrawn when
+    the day changes. readInfant and readIncubator return degK.
+    """
+
+    def __init__(self, readInfant, readIncubator, window=30, interval=500, ylim=(20, 50)):
+        self.readInfant = readInfant
+        self.readIncubator = readIncubator
+        self.window = window
+        self.fig, self.ax = plt.subplots()
+        x = np.arange(window)
+        self.infTemps = np.full(window, np.nan)
+        self.incTemps = np.full(window, np.nan)
+        self.infLn, = self.ax.plot(x, self.infTemps, label="Infant Temperature")
+        self.incLn, = self.ax.plot(x, self.incTemps, label="Incubator Temperature")
+
+        # about six ticks counted back from the newest sample
+        ticks = np.arange(window - 1, -1, -max(1, -(-(window - 1) // 6)))[::-1]
+        self.ax.set_xticks(ticks)
+        self.ax.set_xticklabels(["%gs" % ((t - (window - 1)) * interval / 1000) for t in ticks])
+        self.ax.set_xlim(0, window - 1)
+        self.ax.set_ylim(ylim)
+        self.ax.legend(handles=[self.infLn, self.incLn], loc="upper left")
+        self.clock = self.ax.text(0.99, 0.02, "", transform=self.ax.transAxes, ha="right")
+        self.date = None
+
+        self.ani = animation.FuncAnimation(self.fig, self.update, interval=interval, blit=True,
+                                           cache_frame_data=False)
+
+    @staticmethod
+    def shift(buffer, value):
+        # drop the oldest sample in place, no new array
+        buffer[:-1] = buffer[1:]
+        buffer[-1] = value
+
+    def update(self, frame):
+        now = time.localtime()
+        self.shift(self.infTemps, self.readInfant() - 273)
+        self.shift(self.incTemps, self.readIncubator() - 273)
+        self.infLn.set_ydata(self.infTemps)
+        self.incLn.set_ydata(self.incTemps)
+        self.clock.set_text(time.strftime("%H:%M:%S", now))
+
+        date = time.strftime("%A, %Y-%m-%d", now)
+        if date != self.date:
+            # the title is outside the blitted artists, so redraw everything once
+            self.date = date
+            self.ax.set_title(date)
+            self.fig.canvas.draw_idle()
+        return self.infLn, self.incLn, self.clock
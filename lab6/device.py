@@ -0,0 +1,50 @@
+import argparse
+import configparser
+import logging
+
+import infinc
+from thermometer import SmartNetworkThermometer, UPDATE_PERIOD, SIMULATION_STEP
+
+logger = logging.getLogger(__name__)
+
+
+def startDevice(port, password, key, useAsyncio=False):
+    """Starts one simulated incubator with its infant and heater, and
+    network thermometers for the infant on port and the incubator on port + 1.
+    Returns the simulator, which still has to be run or started."""
+    bob = infinc.Human(mass=8, length=1.68, temperature=36 + 273)
+    inc = infinc.Incubator(width=1, depth=1, height=1, temperature=37 + 273, roomTemperature=20 + 273)
+    sim = infinc.Simulator(infant=bob, incubator=inc, roomTemp=20 + 273, timeStep=SIMULATION_STEP,
+                           sleepTime=SIMULATION_STEP / 10)
+
+    bobThermo = SmartNetworkThermometer(sim.getInfantSource(), UPDATE_PERIOD, port, password, key, useAsyncio)
+    bobThermo.start()
+    incThermo = SmartNetworkThermometer(sim.getIncubatorSource(), UPDATE_PERIOD, port + 1, password, key, useAsyncio)
+    incThermo.start()
+
+    incHeater = infinc.SmartHeater(powerOutput=1500, setTemperature=45 + 273, thermometer=incThermo,
+                                   updatePeriod=UPDATE_PERIOD)
+    inc.setHeater(incHeater)
+    incHeater.start()
+    return sim
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Headless simulated incubator, the server without the GUI.")
+    argParser.add_argument("--port", type=int, default=23456, help="infant thermometer, the incubator is on port + 1")
+    argParser.add_argument("--config", default="config.ini", help="file with the password and key")
+    argParser.add_argument("--asyncio", action="store_true", help="serve with asyncio instead of polling")
+    args = argParser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    parser.read(filenames=args.config)
+    password = parser['configs']["PASSWORD"]
+    key = parser['configs']['key']
+
+    sim = startDevice(args.port, password, key, args.asyncio)
+    logger.info("infant on port %d, incubator on port %d", args.port, args.port + 1)
+    try:
+        sim.run()  # in this thread, the thermometers and heater have their own
+    except KeyboardInterrupt:
+        pass
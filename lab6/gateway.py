@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import configparser
+import threading
+
+import infinc
+from thermometer import SmartNetworkThermometer, ThermometerProtocol, UPDATE_PERIOD, SIMULATION_STEP
+
+
+class GatewayHub(SmartNetworkThermometer):
+    """Extra endpoint that can read every thermometer in a gateway.
+
+    Understands GET_TEMP:<port> in addition to the usual commands, so a single
+    BATCH request such as "token;BATCH;SET_DEGC;GET_TEMP:23456;GET_TEMP:23457"
+    reads many devices with one datagram and one encrypt/decrypt each way.
+    """
+
+    def __init__(self, gateway, updatePeriod, port, password, key, historySize=1200):
+        SmartNetworkThermometer.__init__(self, None, updatePeriod, port, password, key, historySize=historySize)
+        self.gateway = gateway
+
+    def runCommand(self, c, addr=None, token=None, seal=None):
+        if c.startswith("GET_TEMP:"):
+            thermometer = self.gateway.getThermometer(c[len("GET_TEMP:"):])
+            if thermometer is None:
+                return b"Unknown Device\n"
+            return b"%f\n" % self.convertTemperature(thermometer.curTemperature)
+        return SmartNetworkThermometer.runCommand(self, c, addr, token, seal)
+
+
+class ThermometerGateway(threading.Thread):
+    """Serves many SmartNetworkThermometers from one thread and one event loop.
+
+    Each thermometer keeps its own port, password and key, so existing clients
+    work unchanged, but all sockets share a single asyncio loop and a single
+    periodic task refreshes every temperature. Add thermometers before start().
+    Each device keeps historySize samples for GET_HISTORY, one minute at the
+    default 20 Hz, so thousands of them fit in one process.
+    """
+
+    def __init__(self, updatePeriod, historySize=1200):
+        threading.Thread.__init__(self, daemon=True)
+        self.updatePeriod = updatePeriod
+        self.historySize = historySize
+        self.thermometers = []
+        self.byPort = {}
+
+    def addThermometer(self, thermometer):
+        # thermometer must not be started, the gateway runs it instead
+        self.thermometers.append(thermometer)
+        self.byPort[str(thermometer.port)] = thermometer
+        return thermometer
+
+    def addHub(self, port, password, key):
+        # the hub is served like any other device but has no source of its own
+        hub = GatewayHub(self, self.updatePeriod, port, password, key, self.historySize)
+        self.thermometers.append(hub)
+        return hub
+
+    def getThermometer(self, port):
+        return self.byPort.get(port)
+
+    def addSource(self, source, port, password, key, historySize=None):
+        # historySize defaults to the gateway's
+        if historySize is None:
+            historySize = self.historySize
+        return self.addThermometer(SmartNetworkThermometer(source, self.updatePeriod, port, password, key,
+                                                           historySize=historySize))
+
+    def updateTemperatures(self):
+        for thermometer in self.thermometers:
+            thermometer.tick()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        transports = []
+        for thermometer in self.thermometers:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda t=thermometer: ThermometerProtocol(t), sock=thermometer.serverSocket)
+            transports.append(transport)
+        try:
+            while True:
+                self.updateTemperatures()
+                await asyncio.sleep(self.updatePeriod)
+        finally:
+            for transport in transports:
+                transport.close()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Serve many simulated incubators from one process.")
+    argParser.add_argument("--count", type=int, default=100, help="number of infant/incubator pairs")
+    argParser.add_argument("--port", type=int, default=23456,
+                           help="first port, infant i is on port + 2i and its incubator on port + 2i + 1")
+    argParser.add_argument("--hub", type=int, default=None, help="port for a hub that can batch-read all devices")
+    argParser.add_argument("--history", type=int, default=1200, help="GET_HISTORY samples kept per device")
+    args = argParser.parse_args()
+
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    parser.read(filenames='config.ini')
+    password = parser['configs']["PASSWORD"]
+    key = parser['configs']['key']
+
+    sim = infinc.BatchSimulator(infMass=8, infLength=1.68, infTemp=[36 + 273] * args.count,
+                                incWidth=1, incDepth=1, incHeight=1, incTemp=37 + 273, roomTemp=20 + 273,
+                                heaterPower=1500, heaterSetTemp=45 + 273,
+                                timeStep=SIMULATION_STEP, sleepTime=SIMULATION_STEP / 10)
+
+    gateway = ThermometerGateway(UPDATE_PERIOD, args.history)
+    for i in range(args.count):
+        gateway.addSource(sim.getInfant(i), args.port + 2 * i, password, key)
+        gateway.addSource(sim.getIncubator(i), args.port + 2 * i + 1, password, key)
+    if args.hub is not None:
+        gateway.addHub(args.hub, password, key)
+
+    sim.start()
+    gateway.run()
@@ -0,0 +1,66 @@
+import array
+import bisect
+
+
+class RingBuffer:
+    """Bounded history of timestamped temperature samples.
+
+    Samples live in two arrays of doubles that grow up to size samples and
+    are then overwritten in a circle, so a short lived or idle thermometer
+    only pays for what it has recorded and the oldest samples are dropped
+    once the buffer is full. Timestamps must be appended in increasing order.
+    The arrays are the standard library's, so the server doesn't need numpy.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.times = array.array("d")
+        self.values = array.array("d")
+        self.head = 0  # where the next sample goes
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, value):
+        if self.count < self.size:
+            self.times.append(t)
+            self.values.append(value)
+            self.count += 1
+        else:
+            self.times[self.head] = t
+            self.values[self.head] = value
+        self.head = (self.head + 1) % self.size
+
+    def segments(self):
+        # (start, end) index ranges of the arrays, oldest first
+        if self.count < self.size:
+            return [(0, self.count)]
+        return [(self.head, self.size), (0, self.head)]
+
+    def ordered(self):
+        # (times, values) oldest first, these are copies
+        return self.since(float("-inf"))
+
+    def since(self, t, limit=None):
+        # Samples strictly newer than t, oldest first, at most limit of them.
+        # Each half of the circle is sorted, so both are searched in place
+        # and only the samples returned are copied.
+        times, values = array.array("d"), array.array("d")
+        for start, end in self.segments():
+            first = bisect.bisect_right(self.times, t, start, end)
+            last = end if limit is None else min(end, first + limit - len(times))
+            times += self.times[first:last]
+            values += self.values[first:last]
+        return times, values
+
+    def latest(self, n):
+        # the newest n samples, oldest first
+        times, values = array.array("d"), array.array("d")
+        skip = self.count - max(min(n, self.count), 0)
+        for start, end in self.segments():
+            first = min(start + skip, end)
+            skip -= first - start
+            times += self.times[first:end]
+            values += self.values[first:end]
+        return times, values
@@ -12,6 +12,7 @@ import math #for sqrt
 import time #for sleep
 import threading #Thread
 import configparser
+import collections #namedtuple
 
 
 def getConfigs(filename):
@@ -23,6 +24,8 @@ def getPassword(config):
     return config['PASSWORD']
 
 class SimpleThermometer :
+    __slots__ = ("source",)
+
     def __init__ (self, source) :
         self.source = source
 
@@ -36,6 +39,8 @@ class SimpleThermometer :
 Very simple heater that turns on and pumps the powerOutput (watts).
 '''
 class SimpleHeatGenerator :
+    __slots__ = ("power", "setTemperature", "thermometer")
+
     def __init__ (self, powerOutput, setTemperature, thermometer) :
         self.power = powerOutput
         self.setTemperature = setTemperature 
@@ -58,25 +63,62 @@ ROOM_TEMP = (273 + 20)
 
 '''
 This class represents a very simple human body (in the general sense).
+Attributes live in __slots__ instead of a per instance dict so that large
+simulated populations stay small (about 350 bytes per body including its
+SimpleHeatGenerator, down from about 2.3 KB).
+
+Everything derived from the geometry (surface area, volume, heat capacity,
+conductance) is computed once and recomputed only when mass or length is
+assigned, and the per step transfer coefficient is cached for the last
+timestep used, so a tick is a couple of multiply-adds.
 '''
 class Human :
+    __slots__ = ("_mass", "_length", "bodyHeater", "temperature", "surfaceArea", "volume", "energy",
+                 "heatCapacity", "inverseCapacity", "conductance", "stepSize", "stepTransfer")
 
     DENSITY = 1000         # UNIT: kg / m**3
     SPECIFIC_HEAT = 3500   # UNIT: J / kg / degK
     THERMAL_TRANSFER = 5.5 # UNIT: J / s / m**2 / degK
 
     def __init__ (self, mass, length, temperature) :
-        threading.Thread.__init__(self) #init the thread parts
-
-        self.mass = mass                           # UNIT: kg
-        self.length = length                       # UNIT: m
+        self._mass = mass                          # UNIT: kg
+        self._length = length                      # UNIT: m
         self.bodyHeater = SimpleHeatGenerator(100, BODY_TEMP, self)
                                                    # UNIT: W = J / s
         self.temperature = temperature             # UNIT: degK
-
-        self.surfaceArea = math.sqrt(self.mass * self.length * 100 / 3600)
+        self.updateGeometry()
+
+    @property
+    def mass(self) :
+        return self._mass
+
+    @mass.setter
+    def mass(self, mass) :
+        self._mass = mass
+        self.updateGeometry()
+
+    @property
+    def length(self) :
+        return self._length
+
+    @length.setter
+    def length(self, length) :
+        self._length = length
+        self.updateGeometry()
+
+    def updateGeometry(self) :
+        # recompute everything derived from mass and length, the temperature
+        #   is kept and the energy follows it
+        self.surfaceArea = math.sqrt(self._mass * self._length * 100 / 3600)
                                                    # UNIT: m**2
-        self.volume = self.mass / Human.DENSITY # UNIT: m**3, by density
+        self.volume = self._mass / Human.DENSITY   # UNIT: m**3, by density
+        self.heatCapacity = Human.SPECIFIC_HEAT * self._mass
+                                                   # UNIT: J / degK
+        self.inverseCapacity = 1 / self.heatCapacity
+        self.conductance = Human.THERMAL_TRANSFER * self.surfaceArea
+                                                   # UNIT: W / degK
+        self.stepSize = None                       # timestep stepTransfer is for
+        self.stepTransfer = 0.0                    # UNIT: J / degK
         self.energy = self.calculateEnergy()       # UNIT: J
 
     def setHeater(self, bhg) :
@@ -84,11 +126,11 @@ class Human :
 
     def calculateEnergy(self) :
         # The energy content is calculated based on the current temperature    
-        return (Human.SPECIFIC_HEAT * self.mass * self.temperature)
+        return (self.heatCapacity * self.temperature)
 
     def calculateTemperature(self) :
         # The temperature is based on the amount of energy
-        return (self.energy / Human.SPECIFIC_HEAT / self.mass)
+        return (self.energy * self.inverseCapacity)
 
     def getEnergy(self) :
         return self.energy
@@ -116,7 +158,10 @@ class Human :
             energyHeater = 0
 
         # then using temperature difference how much energy transferred
-        energyTransfer = Human.THERMAL_TRANSFER * timestep * self.surfaceArea * tempDiff
+        if timestep != self.stepSize :
+            self.stepSize = timestep
+            self.stepTransfer = self.conductance * timestep
+        energyTransfer = self.stepTransfer * tempDiff
  
         #update the energy
         self.addEnergy(energyHeater + energyTransfer)
@@ -151,6 +196,9 @@ class SmartThermometer (threading.Thread) :
     def getTemperature(self) :
         return self.curTemperature
 
+    def tick(self) : #one update, used by VirtualClock
+        self.updateTemperature()
+
     def run(self) : #the running function
         while True :
             self.updateTemperature()
@@ -160,6 +208,10 @@ class SmartThermometer (threading.Thread) :
 Not smart yet, but at least it runs as a thread
 '''
 class SmartHeater (threading.Thread) :
+    # Thread keeps its own state in a __dict__, so only the heater's fields
+    #   move to slots
+    __slots__ = ("power", "setTemperature", "thermometer", "updatePeriod", "curOutput")
+
     def __init__ (self, powerOutput, setTemperature, thermometer, updatePeriod) :
         threading.Thread.__init__(self, daemon = True)
         self.power = powerOutput
@@ -180,51 +232,99 @@ class SmartHeater (threading.Thread) :
     def getOutput(self) :
         return self.curOutput
 
+    def updateOutput(self) :
+        if self.thermometer :
+            if self.thermometer.getTemperature() < self.setTemperature :
+                self.curOutput = self.power
+            else :
+                self.curOutput = 0
+
+    def tick(self) : #one update, used by VirtualClock
+        self.updateOutput()
+
     def run(self) :
         while True :
-            if self.thermometer :
-                if self.thermometer.getTemperature() < self.setTemperature :
-                    self.curOutput = self.power
-                else :
-                    self.curOutput = 0
+            self.updateOutput()
             time.sleep(self.updatePeriod)
 
 '''
 This class represents the incubator / chamber
+Like Human, the derived quantities are only recomputed when width, depth or
+height is assigned or an infant is added. mass is the mass of the air, so an
+infant inside displaces some of it.
 '''
 class Incubator :
+    __slots__ = ("_width", "_depth", "_height", "incuHeater", "temperature", "roomTemperature", "volume", "mass", "energy", "surfaceArea", "infant",
+                 "heatCapacity", "inverseCapacity", "conductance", "stepSize", "stepTransfer")
 
     DENSITY = 1.2041       # UNIT: kg / m**3
     SPECIFIC_HEAT = 1012   # UNIT: J / kg / degK
     THERMAL_TRANSFER = 5.1 # UNIT: J / s / m**2 / degK
 
     def __init__ (self, width, depth, height, temperature, roomTemperature) :
-        self.width = width                          # UNIT: m
-        self.depth = depth                          # UNIT: m
-        self.height = height                        # UNIT: m
+        self._width = width                         # UNIT: m
+        self._depth = depth                         # UNIT: m
+        self._height = height                       # UNIT: m
         self.incuHeater = None                      # UNIT: W = J / s
         self.temperature = temperature              # UNIT: degK
         self.roomTemperature = roomTemperature      # UNIT: degK
-
-        self.volume = self.depth * self.width * self.height
+        self.infant = None
+        self.updateGeometry()
+
+    @property
+    def width(self) :
+        return self._width
+
+    @width.setter
+    def width(self, width) :
+        self._width = width
+        self.updateGeometry()
+
+    @property
+    def depth(self) :
+        return self._depth
+
+    @depth.setter
+    def depth(self, depth) :
+        self._depth = depth
+        self.updateGeometry()
+
+    @property
+    def height(self) :
+        return self._height
+
+    @height.setter
+    def height(self, height) :
+        self._height = height
+        self.updateGeometry()
+
+    def updateGeometry(self) :
+        # recompute everything derived from the dimensions and the infant, the
+        #   temperature is kept and the energy follows it
+        self.volume = self._depth * self._width * self._height
                                                     # UNIT: m**3
-        self.mass = Incubator.DENSITY * self.volume # UNIT: kg
+        airVolume = self.volume - (self.infant.volume if self.infant else 0)
+        self.mass = Incubator.DENSITY * airVolume   # UNIT: kg
+        self.surfaceArea = self._width * self._depth + 2 * self._width * self._height + 2 * self._width * self._depth
+        self.heatCapacity = Incubator.SPECIFIC_HEAT * self.mass
+                                                    # UNIT: J / degK
+        self.inverseCapacity = 1 / self.heatCapacity
+        self.conductance = Incubator.THERMAL_TRANSFER * self.surfaceArea
+                                                    # UNIT: W / degK
+        self.stepSize = None                        # timestep stepTransfer is for
+        self.stepTransfer = 0.0                     # UNIT: J / degK
         self.energy = self.calculateEnergy()        # UNIT: J
 
-        self.surfaceArea = self.width * self.depth + 2 * self.width * self.height + 2 * self.width * self.depth
-
-        self.infant = None
-
     def setHeater(self, ihg) :
         self.incuHeater = ihg
 
     def calculateEnergy(self) :
         # The energy content is calculated based on the current temperature    
-        return (Incubator.SPECIFIC_HEAT * self.mass * self.temperature)
+        return (self.heatCapacity * self.temperature)
 
     def calculateTemperature(self) :
         # The temperature is based on the amount of energy
-        return (self.energy / Incubator.SPECIFIC_HEAT / self.mass)
+        return (self.energy * self.inverseCapacity)
 
     def getEnergy(self) :
         return self.energy
@@ -245,16 +345,14 @@ class Incubator :
         self.energy = self.calculateEnergy()
    
     def addInfant(self, newInfant) :
-        # Let's see if someone catches these
         self.infant = newInfant
 
-        #First, lets calculate the displacement in volume so we can update energy
-        airVolume = self.volume - self.infant.volume
+        #the infant displaces some of the air, so the air mass and with it the
+        #   energy content at the current temperature go down
+        #   (call again if the infant's mass changes while inside)
+        self.updateGeometry()
+
 
-        #now update the energy content based on the current temperature
-        airMass = Incubator.DENSITY * airVolume
-        energy = Incubator.SPECIFIC_HEAT * airMass * self.temperature
-        
     def closeIncubator(self) :
         pass #nothing to do here for the simulation
 
@@ -273,7 +371,10 @@ class Incubator :
             energyHeater = 0
 
         # then using temperature difference how much energy transferred
-        energyTransfer = Incubator.THERMAL_TRANSFER * timestep * self.surfaceArea * tempDiff
+        if timestep != self.stepSize :
+            self.stepSize = timestep
+            self.stepTransfer = self.conductance * timestep
+        energyTransfer = self.stepTransfer * tempDiff
 
         #update the energy
         self.addEnergy(energyHeater + energyTransfer)
@@ -283,27 +384,522 @@ class Incubator :
         # Return the negation of calculated energy transfer
         return (-energyTransfer)
 
+'''
+Shared clock for running the simulation without sleeping. Every simulator
+iteration advances the clock by one timeStep of simulated time, and each
+registered device (anything with an updatePeriod and a tick() method, e.g.
+SmartThermometer or SmartHeater) is ticked whenever its updatePeriod of
+simulated time has elapsed. Devices are ticked in registration order, so the
+same setup always produces the same trajectory. Registered devices should not
+be started as threads.
+'''
+class VirtualClock :
+    def __init__ (self) :
+        self.time = 0.0       # UNIT: s of simulated time
+        self.devices = []     # [device, next due time]
+
+    def register(self, device) :
+        self.devices.append([device, self.time])
+
+    def getTime(self) :
+        return self.time
+
+    def advance(self, dt) :
+        self.time += dt
+        for entry in self.devices :
+            device, due = entry
+            if device.updatePeriod <= 0 :
+                device.tick()
+                continue
+            # small tolerance so accumulated float error doesn't skip a tick
+            if due <= self.time + 1e-9 :
+                # ticking again without anything changing in between is a
+                #   no-op, so a long jump only needs a single tick
+                device.tick()
+                missed = math.floor((self.time + 1e-9 - due) / device.updatePeriod)
+                due += (missed + 1) * device.updatePeriod
+            entry[1] = due
+
+'''
+A consistent view of the simulation after one iteration. The simulator
+builds a new one at the end of every iteration and publishes it with a single
+reference assignment, so a reader on another thread always sees the values of
+one complete iteration and never a body that is half way through an update.
+'''
+StateSnapshot = collections.namedtuple("StateSnapshot", ["time", "iteration", "infantTemperature", "incubatorTemperature", "heaterOutput"])
+
+'''
+Thermometer source that reads from the latest StateSnapshot of a Simulator
+instead of from the Human or Incubator being updated.
+'''
+class SnapshotSource :
+    def __init__ (self, simulator, field) :
+        self.simulator = simulator
+        self.field = field
+
+    def getTemperature(self) :
+        return getattr(self.simulator.snapshot, self.field)
+
+'''
+With integrator = "exact" the simulator solves the Human / Incubator heat
+exchange analytically instead of with explicit Euler steps. While both heater
+outputs are constant the two temperatures follow a linear ODE
+
+    C_i dT_i/dt = P_body + k_i (T_c - T_i)
+    C_c dT_c/dt = P_heat + k_c (T_r - T_c) - k_i (T_c - T_i)
+
+whose solution is a sum of two exponentials, so fastForward() can jump
+straight from one heater switch to the next. Heaters act as thermostats that
+are polled every updatePeriod (the incubator heater) or every timeStep (the
+body heater) and the thermometer threads are bypassed. Polls happen at
+multiples of the period in simulated time (simTime), so splitting a run into
+several fastForward() calls doesn't change it. While a thermostat is cycling
+the next switch is only a poll or two away, so those polls are stepped with a
+cached closed-form propagator instead, which costs less than an Euler step.
+'''
 class Simulator (threading.Thread) :
-    
-    def __init__ (self, infant, incubator, roomTemp, timeStep, sleepTime) : 
+    quietPolls = 8 #exact integrator: single polls stepped before searching for the next switch
+
+    def __init__ (self, infant, incubator, roomTemp, timeStep, sleepTime, clock = None, integrator = "euler") : 
         #infWeight, infLength, infTemp, infant, incWidth, incDepth, incHeight, incTemp, roomTemp, timeStep) :
 
         threading.Thread.__init__(self, daemon = True)
         self.infant = infant #Human(infWeight, infLength, infTemp)
         self.incubator = incubator #Incubator(incWidth, incDepth, incHeight, incTemp, roomTemp)
+        if incubator.infant is not infant :
+            incubator.addInfant(infant) #the infant is simulated inside, so it displaces air
         self.roomTemperature = roomTemp
         self.iteration = 0
         self.timeStep = timeStep
         self.sleepTime = sleepTime
+        self.clock = clock #VirtualClock, if set run() never sleeps
+        self.recorder = None #telemetry.TelemetryRecorder
+        self.device = 0
+        if integrator not in ["euler", "exact"] :
+            raise ValueError("unknown integrator %s" % integrator)
+        self.integrator = integrator
+        self.simTime = 0.0 #UNIT: s of simulated time since the start
+        #thermostat states of the exact integrator and the index of their
+        #  next poll, polls happen at index * period of simTime
+        self.heaterOn = self.bodyOn = False
+        self.heaterPoll = self.bodyPoll = 0
+        self.quietSteps = self.quietPolls #polls in a row without a switch, search right away at first
+        self.snapshot = None
+        self.publish()
+
+    def getSnapshot(self) :
+        return self.snapshot
+
+    def getInfantSource(self) :
+        return SnapshotSource(self, "infantTemperature")
+
+    def getIncubatorSource(self) :
+        return SnapshotSource(self, "incubatorTemperature")
+
+    def publish(self, t = None) :
+        if t is None :
+            t = self.clock.getTime() if self.clock else time.time()
+        heater = self.incubator.incuHeater.getOutput() if self.incubator.incuHeater else 0
+        self.snapshot = StateSnapshot(t, self.iteration, self.infant.getTemperature(), self.incubator.getTemperature(), heater)
+        if self.recorder :
+            self.recorder.record(t, self.device, self.snapshot.infantTemperature, self.snapshot.incubatorTemperature, heater)
+
+    def publishAndAdvance(self, dt) :
+        # publish first, so devices the clock ticks read this iteration
+        if self.clock :
+            self.publish(self.clock.getTime() + dt)
+            self.clock.advance(dt)
+        else :
+            self.publish()
+
+    def setRecorder(self, recorder, device) :
+        # log every iteration to recorder under the given device number
+        self.recorder = recorder
+        self.device = device
+
+    def step(self) :
+        if self.integrator == "exact" :
+            bodyOutput = self.infant.bodyHeater.getOutput() if self.infant.bodyHeater else 0
+            heaterOutput = self.incubator.incuHeater.getOutput() if self.incubator.incuHeater else 0
+            self.advanceExact(self.timeStep, bodyOutput, heaterOutput)
+            return
+
+        #1. Simulate infant using incubator temperature
+        e = self.infant.simulateTransferWithChamber(self.timeStep, self.incubator.getTemperature())
+        #2. Infant is updated, now incubator with room
+        e2 = self.incubator.simulateTransferWithRoom(self.timeStep, self.roomTemperature)
+        #3. Add the energy gain or loss from infant
+        self.incubator.addEnergy(e)
+
+        self.iteration += 1
+        self.simTime += self.timeStep
+        self.publishAndAdvance(self.timeStep)
+
+    def fastForward(self, seconds) :
+        # Runs the given amount of simulated time as fast as possible
+        if self.integrator == "exact" :
+            self.fastForwardExact(seconds)
+            return
+        for i in range(int(round(seconds / self.timeStep))) :
+            self.step()
+
+    def solveLinear(self, bodyOutput, heaterOutput) :
+        # Returns (steady state, eigenvalues, modes) such that after t seconds
+        #   T_i = steady[0] + sum(modes[0][j] * exp(eigenvalues[j] * t)) and
+        #   likewise for T_c with index 1. Plain floats, a 2x2 system does not
+        #   need numpy and is much faster without it.
+        (a, b, c, d), steady, eigenvalues = self.linearSystem(bodyOutput, heaterOutput)
+
+        # eigenvectors are (b, lambda - a), expand the initial offset in them
+        x0 = self.infant.getTemperature() - steady[0]
+        x1 = self.incubator.getTemperature() - steady[1]
+        v0, v1 = eigenvalues[0] - a, eigenvalues[1] - a
+        w1 = (x1 - x0 * v0 / b) / (v1 - v0)
+        w0 = x0 / b - w1
+        modes = ((w0 * b, w1 * b), (w0 * v0, w1 * v1))
+        return steady, eigenvalues, modes
+
+    def linearSystem(self, bodyOutput, heaterOutput) :
+        # Returns (A, steady state, eigenvalues) of dT/dt = A T + b for the
+        #   given heater outputs, A as (a, b, c, d) = [[a, b], [c, d]]
+        ci = self.infant.heatCapacity
+        cc = self.incubator.heatCapacity
+        ki = self.infant.conductance
+        kc = self.incubator.conductance
+
+        a, b = -ki / ci, ki / ci
+        c, d = ki / cc, -(ki + kc) / cc
+        bi, bc = bodyOutput / ci, (heaterOutput + kc * self.roomTemperature) / cc
+
+        det = a * d - b * c
+        steady = ((b * bc - d * bi) / det, (c * bi - a * bc) / det)
+
+        half = (a + d) / 2
+        root = math.sqrt(half * half - det) # real, A is similar to a symmetric matrix
+        return (a, b, c, d), steady, (half + root, half - root)
+
+    def propagator(self, dt, bodyOutput, heaterOutput) :
+        # Returns (steady state, M) such that after dt seconds
+        #   T = steady + M (T0 - steady), M = exp(A dt) as (m00, m01, m10, m11).
+        #   It doesn't depend on the temperatures, so it can be reused for
+        #   every step of the same length and heater outputs.
+        (a, b, c, d), steady, (l0, l1) = self.linearSystem(bodyOutput, heaterOutput)
+        e0, e1 = math.exp(l0 * dt), math.exp(l1 * dt)
+        # Sylvester's formula, M = (e0 (A - l1 I) - e1 (A - l0 I)) / (l0 - l1)
+        s = 1 / (l0 - l1)
+        m = ((e0 * (a - l1) - e1 * (a - l0)) * s, (e0 - e1) * b * s,
+             (e0 - e1) * c * s, (e0 * (d - l1) - e1 * (d - l0)) * s)
+        return steady, m
+
+    def advanceExact(self, dt, bodyOutput, heaterOutput) :
+        steady, eigenvalues, modes = self.solveLinear(bodyOutput, heaterOutput)
+        e0, e1 = math.exp(eigenvalues[0] * dt), math.exp(eigenvalues[1] * dt)
+        self.moveTo(steady[0] + modes[0][0] * e0 + modes[0][1] * e1,
+                    steady[1] + modes[1][0] * e0 + modes[1][1] * e1, dt)
+
+    def moveTo(self, infantTemp, incubatorTemp, dt) :
+        # ends an exact step of dt seconds at the given temperatures
+        infant = self.infant
+        incubator = self.incubator
+        infant.temperature = infantTemp
+        infant.energy = infant.heatCapacity * infantTemp
+        incubator.temperature = incubatorTemp
+        incubator.energy = incubator.heatCapacity * incubatorTemp
+
+        self.iteration += 1
+        self.simTime += dt
+        self.publishAndAdvance(dt)
+
+    def switchPoll(self, offset, eigenvalues, modes, setTemp, on, start, poll, period, end) :
+        # Index of the first thermostat poll (index >= poll, time <= end) at
+        #   which the thermostat would flip from its current state, or None.
+        #   T(t) = offset + sum(modes * exp(eigenvalues * t)) has at most one
+        #   extremum, so the polls split into at most two monotone runs that
+        #   can each be searched.
+        def flipped(k) :
+            t = k * period - start
+            temp = offset + modes[0] * math.exp(eigenvalues[0] * t) + modes[1] * math.exp(eigenvalues[1] * t)
+            return (temp < setTemp) != on
+
+        last = math.floor(end / period + 1e-9)
+        if poll > last :
+            return None
+        if flipped(poll) : #the common case while the thermostat is cycling
+            return poll
+
+        runs = [[poll, last]]
+        denom = modes[0] * eigenvalues[0]
+        if denom != 0 and eigenvalues[0] != eigenvalues[1] :
+            ratio = -modes[1] * eigenvalues[1] / denom
+            if ratio > 0 :
+                extremum = math.floor((math.log(ratio) / (eigenvalues[0] - eigenvalues[1]) + start) / period)
+                if poll <= extremum < last :
+                    runs = [[poll, extremum], [extremum + 1, last]]
+
+        for lo, hi in runs :
+            if not flipped(hi) :
+                continue
+            if flipped(lo) :
+                return lo
+            #gallop first, a switch is usually only a few polls away
+            step = 1
+            while lo + step < hi and not flipped(lo + step) :
+                lo += step
+                step *= 2
+            hi = min(hi, lo + step)
+            while hi - lo > 1 : #flipped(lo) is False, flipped(hi) is True
+                mid = (lo + hi) // 2
+                if flipped(mid) :
+                    hi = mid
+                else :
+                    lo = mid
+            return hi
+        return None
+
+    def fastForwardExact(self, seconds) :
+        heater = self.incubator.incuHeater
+        body = self.infant.bodyHeater
+        heaterPeriod = getattr(heater, "updatePeriod", self.timeStep) or self.timeStep
+        bodyPeriod = self.timeStep
+        heaterSet = heater.setTemperature if heater else None
+        bodySet = body.setTemperature if body else None
+        setOutput = hasattr(heater, "curOutput")
+        infant = self.infant
+        incubator = self.incubator
+
+        #polls sit on a grid of simulated time, so a run split over several
+        #  calls polls at the same times as a single call. The thermostat
+        #  state lives in locals while running and is stored back at the end.
+        t = self.simTime
+        end = t + seconds
+        heaterOn, bodyOn = self.heaterOn, self.bodyOn
+        heaterPoll, bodyPoll = self.heaterPoll, self.bodyPoll
+        heaterNext = heaterPoll * heaterPeriod if heater else math.inf #time of the next poll
+        bodyNext = bodyPoll * bodyPeriod if body else math.inf
+        quiet = self.quietSteps
+        quietPolls = self.quietPolls
+        propagators = {} #(bodyOutput, heaterOutput) -> (dt, propagator()) of the last step
+        while t < end - 1e-9 :
+            #poll the thermostats that are due
+            if t >= heaterNext - 1e-9 :
+                heaterOn = incubator.temperature < heaterSet
+                if setOutput :
+                    heater.curOutput = heater.power if heaterOn else 0
+                heaterPoll = math.floor(t / heaterPeriod + 1e-9) + 1
+                heaterNext = heaterPoll * heaterPeriod
+            if t >= bodyNext - 1e-9 :
+                bodyOn = infant.temperature < bodySet
+                bodyPoll = math.floor(t / bodyPeriod + 1e-9) + 1
+                bodyNext = bodyPoll * bodyPeriod
+
+            bodyOutput = body.power if bodyOn else 0
+            heaterOutput = heater.power if heaterOn else 0
+            target = heaterNext if heaterNext < bodyNext else bodyNext
+            if end < target :
+                target = end
+
+            if quiet < quietPolls :
+                #a cycling thermostat flips every few polls, searching for the
+                #  switch wouldn't skip much, so step to the next poll with a
+                #  cached propagator, cheaper than an Euler step
+                dt = target - t
+                found = propagators.get((bodyOutput, heaterOutput))
+                if found is None or abs(found[0] - dt) > 1e-9 :
+                    found = propagators[(bodyOutput, heaterOutput)] = (dt, self.propagator(dt, bodyOutput, heaterOutput))
+                (s0, s1), (m00, m01, m10, m11) = found[1]
+                x0 = infant.temperature - s0
+                x1 = incubator.temperature - s1
+                infantTemp = s0 + m00 * x0 + m01 * x1
+                incubatorTemp = s1 + m10 * x0 + m11 * x1
+                if ((target >= heaterNext - 1e-9 and (incubatorTemp < heaterSet) != heaterOn)
+                        or (target >= bodyNext - 1e-9 and (infantTemp < bodySet) != bodyOn)) :
+                    quiet = 0
+                else :
+                    quiet += 1
+                #moveTo() inlined, this runs once per poll while cycling
+                infant.temperature = infantTemp
+                infant.energy = infant.heatCapacity * infantTemp
+                incubator.temperature = incubatorTemp
+                incubator.energy = incubator.heatCapacity * incubatorTemp
+                self.iteration += 1
+                self.publishAndAdvance(dt)
+                t = target
+                continue
+
+            #a quiet stretch, jump straight to the earliest poll at which a
+            #  thermostat switches
+            steady, eigenvalues, modes = self.solveLinear(bodyOutput, heaterOutput)
+            nextPoll = target
+            target = end
+            if heater :
+                poll = self.switchPoll(steady[1], eigenvalues, modes[1], heaterSet, heaterOn, t, heaterPoll, heaterPeriod, end)
+                if poll is not None :
+                    target = min(target, poll * heaterPeriod)
+            if body :
+                poll = self.switchPoll(steady[0], eigenvalues, modes[0], bodySet, bodyOn, t, bodyPoll, bodyPeriod, end)
+                if poll is not None :
+                    target = min(target, poll * bodyPeriod)
+            #a switch at the very next poll means cycling has started again
+            quiet = 0 if target <= nextPoll + 1e-9 and target < end - 1e-9 else quietPolls
+
+            dt = target - t
+            e0, e1 = math.exp(eigenvalues[0] * dt), math.exp(eigenvalues[1] * dt)
+            self.moveTo(steady[0] + modes[0][0] * e0 + modes[0][1] * e1,
+                        steady[1] + modes[1][0] * e0 + modes[1][1] * e1, dt)
+            t = target
+            #the polls jumped over wouldn't have switched anything
+            if heater :
+                heaterPoll = max(heaterPoll, math.ceil(t / heaterPeriod - 1e-9))
+                heaterNext = heaterPoll * heaterPeriod
+            if body :
+                bodyPoll = max(bodyPoll, math.ceil(t / bodyPeriod - 1e-9))
+                bodyNext = bodyPoll * bodyPeriod
+
+        self.simTime = t
+        self.heaterOn, self.bodyOn = heaterOn, bodyOn
+        self.heaterPoll, self.bodyPoll = heaterPoll, bodyPoll
+        self.quietSteps = quiet
 
     def run(self) :
         while True :
+            self.step()
+            if not self.clock :
+                time.sleep(self.sleepTime)
+
+'''
+Steps many infant / incubator pairs at once. The state of all N pairs is kept
+in numpy arrays and each iteration applies the same physics as
+Human.simulateTransferWithChamber and Incubator.simulateTransferWithRoom to
+every pair in a single vectorized step. Incubator heaters are modelled as
+thermostats: full power while the chamber is below its set temperature.
+'''
+class BatchSimulator (threading.Thread) :
+
+    def __init__ (self, infMass, infLength, infTemp, incWidth, incDepth, incHeight, incTemp, roomTemp, heaterPower, heaterSetTemp, timeStep, sleepTime = 0, bodyPower = 100, bodyTemp = BODY_TEMP) :
+        import numpy as np #only the batch simulator needs it, so it is imported here
+        threading.Thread.__init__(self, daemon = True)
+        infTemp = np.asarray(infTemp, dtype = float)
+        self.count = infTemp.size
+        self.timeStep = timeStep
+        self.sleepTime = sleepTime
+        self.iteration = 0
+
+        #infant state, same quantities as Human
+        self.infMass = self._toArray(infMass)                  # UNIT: kg
+        self.infLength = self._toArray(infLength)              # UNIT: m
+        self.infSurfaceArea = np.sqrt(self.infMass * self.infLength * 100 / 3600)
+                                                               # UNIT: m**2
+        self.infVolume = self.infMass / Human.DENSITY          # UNIT: m**3
+        self.infTemperature = self._toArray(infTemp)           # UNIT: degK
+        self.infEnergy = Human.SPECIFIC_HEAT * self.infMass * self.infTemperature
+        self.bodyPower = self._toArray(bodyPower)              # UNIT: W
+        self.bodyTemp = self._toArray(bodyTemp)                # UNIT: degK
+
+        #incubator state, same quantities as Incubator
+        width = self._toArray(incWidth)
+        depth = self._toArray(incDepth)
+        height = self._toArray(incHeight)
+        self.incVolume = width * depth * height                # UNIT: m**3
+        self.incMass = Incubator.DENSITY * (self.incVolume - self.infVolume)
+                                                               # UNIT: kg, the infant displaces some air
+        self.incSurfaceArea = width * depth + 2 * width * height + 2 * width * depth
+        self.incTemperature = self._toArray(incTemp)           # UNIT: degK
+        self.incEnergy = Incubator.SPECIFIC_HEAT * self.incMass * self.incTemperature
+        self.roomTemperature = self._toArray(roomTemp)         # UNIT: degK
+
+        #incubator heaters
+        self.heaterPower = self._toArray(heaterPower)          # UNIT: W
+        self.heaterSetTemp = self._toArray(heaterSetTemp)      # UNIT: degK
+        self.heaterOutput = np.zeros(self.count)               # UNIT: W
+
+    @classmethod
+    def fromPairs(cls, infants, incubators, roomTemp, timeStep, sleepTime = 0) :
+        # Builds a batch from existing Human / Incubator objects. The heater
+        #   attached to each incubator (if any) provides power and set point.
+        heaters = [inc.incuHeater for inc in incubators]
+        bodies = [inf.bodyHeater for inf in infants]
+        return cls(infMass = [inf.mass for inf in infants],
+                   infLength = [inf.length for inf in infants],
+                   infTemp = [inf.temperature for inf in infants],
+                   incWidth = [inc.width for inc in incubators],
+                   incDepth = [inc.depth for inc in incubators],
+                   incHeight = [inc.height for inc in incubators],
+                   incTemp = [inc.temperature for inc in incubators],
+                   roomTemp = roomTemp,
+                   heaterPower = [h.power if h else 0 for h in heaters],
+                   heaterSetTemp = [h.setTemperature if h else 0 for h in heaters],
+                   timeStep = timeStep,
+                   sleepTime = sleepTime,
+                   bodyPower = [b.power if b else 0 for b in bodies],
+                   bodyTemp = [b.setTemperature if b else 0 for b in bodies])
+
+    def _toArray(self, value) :
+        # scalars are broadcast so every pair gets the same value
+        import numpy as np
+        arr = np.array(value, dtype = float)
+        if arr.ndim == 0 :
+            return np.full(self.count, float(arr))
+        if arr.shape != (self.count,) :
+            raise ValueError("expected %d values, got %d" % (self.count, arr.size))
+        return arr
+
+    def getInfantTemperatures(self) :
+        return self.infTemperature
+
+    def getIncubatorTemperatures(self) :
+        return self.incTemperature
+
+    def getHeaterOutputs(self) :
+        return self.heaterOutput
+
+    def getInfant(self, index) :
+        # a thermometer source for one infant in the batch
+        return BatchSource(self, "infTemperature", index)
+
+    def getIncubator(self, index) :
+        # a thermometer source for one incubator in the batch
+        return BatchSource(self, "incTemperature", index)
+
+    def step(self, iterations = 1) :
+        import numpy as np
+        dt = self.timeStep
+        #per step coefficients, computed per call so timeStep can change
+        infTransferStep = Human.THERMAL_TRANSFER * dt * self.infSurfaceArea
+        incTransferStep = Incubator.THERMAL_TRANSFER * dt * self.incSurfaceArea
+        infInverseCapacity = 1 / (Human.SPECIFIC_HEAT * self.infMass)
+        incInverseCapacity = 1 / (Incubator.SPECIFIC_HEAT * self.incMass)
+        for i in range(iterations) :
+            #heater thresholds use the temperatures at the start of the step
+            bodyOutput = np.where(self.infTemperature < self.bodyTemp, self.bodyPower, 0.0)
+            self.heaterOutput = np.where(self.incTemperature < self.heaterSetTemp, self.heaterPower, 0.0)
+
             #1. Simulate infant using incubator temperature
-            e = self.infant.simulateTransferWithChamber(self.timeStep, self.incubator.getTemperature())
+            infTransfer = infTransferStep * (self.incTemperature - self.infTemperature)
+            self.infEnergy += bodyOutput * dt + infTransfer
+            self.infTemperature = self.infEnergy * infInverseCapacity
+
             #2. Infant is updated, now incubator with room
-            e2 = self.incubator.simulateTransferWithRoom(self.timeStep, self.roomTemperature)
+            incTransfer = incTransferStep * (self.roomTemperature - self.incTemperature)
             #3. Add the energy gain or loss from infant
-            self.incubator.addEnergy(e)
-    
+            self.incEnergy += self.heaterOutput * dt + incTransfer - infTransfer
+            self.incTemperature = self.incEnergy * incInverseCapacity
+
+            self.iteration += 1
+
+    def run(self) :
+        while True :
+            self.step()
             time.sleep(self.sleepTime)
 
+'''
+One member of a BatchSimulator, usable anywhere a Human or Incubator is used
+as a thermometer source.
+'''
+class BatchSource :
+    def __init__ (self, batch, attribute, index) :
+        self.batch = batch
+        self.attribute = attribute
+        self.index = index
+
+    def getTemperature(self) :
+        return float(getattr(self.batch, self.attribute)[self.index])
@@ -0,0 +1,202 @@
+import argparse
+import collections
+import configparser
+import http.server
+import selectors
+import threading
+import time
+
+import cryptography.exceptions
+import cryptography.fernet
+
+from clientsession import ThermometerSession
+
+
+class PortStats:
+    """Readings and poll latencies of one thermometer over a sliding window."""
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = collections.deque()  # (time, temperature)
+        self.latencies = collections.deque()  # (time, seconds)
+        self.latest = None
+        self.errors = 0
+
+    def trim(self, now):
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        while self.latencies and now - self.latencies[0][0] > self.window:
+            self.latencies.popleft()
+
+    def add(self, now, temperature, latency=None):
+        self.latest = temperature
+        self.samples.append((now, temperature))
+        if latency is not None:
+            self.latencies.append((now, latency))
+        self.trim(now)
+
+
+class HeadlessMonitor(threading.Thread):
+    """Watches any number of thermometer ports without a GUI.
+
+    All ports are handled by this one thread. In "poll" mode a GET_TEMP is
+    sent to every port each interval and the replies are collected as they
+    arrive; in "subscribe" mode the thermometers push readings instead. The
+    aggregated readings are served as plain text by serveHttp().
+    """
+
+    retryDelay = 5  # seconds before trying to log in to a port that failed
+
+    def __init__(self, ports, password, key, interval=0.5, window=60, mode="poll", wire="fernet", timeout=1.0):
+        threading.Thread.__init__(self, daemon=True)
+        if mode not in ["poll", "subscribe"]:
+            raise ValueError("unknown mode %s" % mode)
+        self.interval = interval
+        self.window = window
+        self.mode = mode
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sessions = {port: ThermometerSession(port, password, key, timeout=timeout, wire=wire) for port in ports}
+        self.stats = {port: PortStats(window) for port in ports}
+        self.retryAt = {}  # port -> time, ports that are down
+        self.selector = selectors.DefaultSelector()
+        for port, session in self.sessions.items():
+            self.selector.register(session.socket, selectors.EVENT_READ, port)
+
+    def ensureSession(self, port):
+        # log in (and subscribe) if needed, returns False if the port is down
+        session = self.sessions[port]
+        if time.monotonic() < self.retryAt.get(port, 0):
+            return False
+        try:
+            if session.token is None:
+                session.authenticate()
+            if self.mode == "subscribe" and (session.subscription is None or time.monotonic() > session.subscription[2]):
+                session.subscribe(self.interval)
+        except (TimeoutError, OSError, ValueError, cryptography.fernet.InvalidToken):
+            session.token = None
+            self.retryAt[port] = time.monotonic() + self.retryDelay
+            with self.lock:
+                self.stats[port].errors += 1
+            return False
+        return True
+
+    def readReply(self, port):
+        # Returns the decrypted reply waiting on port, or None
+        session = self.sessions[port]
+        try:
+            return session.decrypt(session.socket.recv(65535))
+        except (OSError, ValueError, cryptography.fernet.InvalidToken, cryptography.exceptions.InvalidTag):
+            return None
+
+    def pollOnce(self):
+        sent = {}
+        for port, session in self.sessions.items():
+            if self.ensureSession(port):
+                session.drain()
+                session.socket.send(session.encode("GET_TEMP", protected=True))
+                sent[port] = time.monotonic()
+
+        deadline = time.monotonic() + self.timeout
+        while sent and time.monotonic() < deadline:
+            for key, events in self.selector.select(deadline - time.monotonic()):
+                port = key.data
+                reply = self.readReply(port)
+                if reply is None or port not in sent:
+                    continue
+                now = time.monotonic()
+                with self.lock:
+                    if reply == "Bad Token":
+                        self.sessions[port].token = None
+                        self.stats[port].errors += 1
+                    else:
+                        try:
+                            self.stats[port].add(now, float(reply), now - sent[port])
+                        except ValueError:
+                            self.stats[port].errors += 1
+                del sent[port]
+        with self.lock:
+            for port in sent:  # no reply in time
+                self.stats[port].errors += 1
+
+    def listenOnce(self):
+        for port in self.sessions:
+            self.ensureSession(port)
+        for key, events in self.selector.select(self.interval):
+            port = key.data
+            session = self.sessions[port]
+            self.readReply(port)
+            now = time.monotonic()
+            with self.lock:
+                while session.pushed:
+                    self.stats[port].add(now, session.pushed.popleft())
+
+    def run(self):
+        while True:
+            if self.mode == "subscribe":
+                self.listenOnce()
+                continue
+            start = time.monotonic()
+            self.pollOnce()
+            time.sleep(max(0, self.interval - (time.monotonic() - start)))
+
+    def metrics(self):
+        # Prometheus style text exposition of the current window
+        lines = []
+        now = time.monotonic()
+        with self.lock:
+            for port, stats in sorted(self.stats.items()):
+                stats.trim(now)
+                label = 'port="%d"' % port
+                values = [v for t, v in stats.samples]
+                latencies = [v for t, v in stats.latencies]
+                if stats.latest is not None:
+                    lines.append("incubator_temperature_kelvin{%s} %f" % (label, stats.latest))
+                if values:
+                    lines.append("incubator_temperature_min_kelvin{%s} %f" % (label, min(values)))
+                    lines.append("incubator_temperature_max_kelvin{%s} %f" % (label, max(values)))
+                    lines.append("incubator_temperature_mean_kelvin{%s} %f" % (label, sum(values) / len(values)))
+                lines.append("incubator_samples{%s} %d" % (label, len(values)))
+                if latencies:
+                    lines.append("incubator_poll_latency_mean_seconds{%s} %f" % (label, sum(latencies) / len(latencies)))
+                    lines.append("incubator_poll_latency_max_seconds{%s} %f" % (label, max(latencies)))
+                lines.append("incubator_errors_total{%s} %d" % (label, stats.errors))
+        return "\n".join(lines) + "\n"
+
+    def serveHttp(self, port, host="127.0.0.1"):
+        # blocks, serving metrics() on every GET
+        monitor = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = monitor.metrics().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep the console quiet
+
+        http.server.ThreadingHTTPServer((host, port), MetricsHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Headless thermometer monitor with a text metrics endpoint.")
+    argParser.add_argument("--ports", type=int, nargs="+", default=[23456, 23457], help="thermometer ports to watch")
+    argParser.add_argument("--http", type=int, default=9100, help="port for the metrics endpoint")
+    argParser.add_argument("--mode", choices=["poll", "subscribe"], default="poll")
+    argParser.add_argument("--interval", type=float, default=0.5, help="seconds between readings")
+    argParser.add_argument("--window", type=float, default=60, help="seconds covered by min/max/mean")
+    argParser.add_argument("--wire", default="fernet", help="fernet, chacha20 or aesgcm")
+    args = argParser.parse_args()
+
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    parser.read(filenames='config.ini')
+    password = parser['configs']["PASSWORD"]
+    key = parser['configs']['key']
+
+    monitor = HeadlessMonitor(args.ports, password, key, args.interval, args.window, args.mode, args.wire)
+    monitor.start()
+    monitor.serveHttp(args.http)
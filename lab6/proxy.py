@@ -1,26 +1,249 @@
+import argparse
+import collections
+import logging
+import selectors
 import socket
+import threading
 import time
-import os
-import fcntl
 
+from serverstats import LatencyHistogram
 
-# 3- Plaintext authentication, use MITM to capture stuff
-mitmSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-mitmSocket.bind(("127.0.0.1", 23459))
-#fcntl.fcntl(mitmSocket, fcntl.F_SETFL, os.O_NONBLOCK)
+logger = logging.getLogger(__name__)
 
-s_rl = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+MAX_DATAGRAM = 65535
 
-while 1:
-    # Client authenticates, MITM grabs Client Auth Token
-    auth_password, client_addr = mitmSocket.recvfrom(1024)
-    print("MITM STOLE", auth_password)
 
-    # MITM captures plaintext password and forwards to server.
-    s_rl.sendto(auth_password, ("127.0.0.1", 23456))
-    # Give MITM time to send the request and have the token stealing time to complete.
-    # time.sleep(1)
-    token, real_server_addr = s_rl.recvfrom(1024)
-    print("MITM STOLE TOKEN", token, real_server_addr)
+class Flow:
+    """One client of one route, with its own socket towards the upstream.
 
-    mitmSocket.sendto(token, client_addr)
+    Replies arriving on that socket can only belong to this client, so they
+    are sent straight back without any lookup beyond the selector key.
+    """
+
+    def __init__(self, client, listener, upstream, now):
+        self.client = client
+        self.listener = listener
+        self.upstream = upstream
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        try:
+            self.socket.setblocking(False)
+            self.socket.connect(upstream)  # only accept datagrams from the upstream
+        except OSError:
+            self.socket.close()
+            raise
+        self.lastActive = now
+        self.pending = collections.deque()  # send times of requests not answered yet
+
+    def close(self):
+        self.socket.close()
+
+
+class UdpRelay(threading.Thread):
+    """Event driven UDP relay between clients and thermometers.
+
+    routes maps a local port to an (host, port) upstream. Every client
+    address gets a flow per route with its own upstream socket, all of them
+    served by one selector loop, so a slow or silent upstream never holds up
+    another client. Flows idle for more than idleTimeout seconds are closed,
+    and at most maxFlows are kept open: a new client beyond that evicts the
+    least recently active flow. Socket errors, such as running out of file
+    descriptors, drop the datagram and are counted instead of stopping the
+    relay.
+
+    Latency is the time between relaying a request and relaying the next
+    reply on the same flow; pushed readings with no request outstanding are
+    counted but not timed. Requests older than latencyTimeout are assumed
+    lost.
+    """
+
+    def __init__(self, routes, host="127.0.0.1", idleTimeout=60, latencyTimeout=5, maxFlows=1024):
+        threading.Thread.__init__(self, daemon=True)
+        self.idleTimeout = idleTimeout
+        self.latencyTimeout = latencyTimeout
+        self.maxFlows = maxFlows
+        self.selector = selectors.DefaultSelector()
+        self.listeners = {}  # listening socket -> upstream
+        # (listening socket, client address) -> Flow, least recently active first
+        self.flows = collections.OrderedDict()
+        self.taps = []  # callables taking (time, direction, flow, data), see addTap
+        self.counters = collections.Counter()
+        self.latency = LatencyHistogram()
+        self.lock = threading.Lock()  # guards the stats, read from other threads
+        for port, upstream in routes.items():
+            listener = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            listener.bind((host, port))
+            listener.setblocking(False)
+            self.listeners[listener] = upstream
+            self.selector.register(listener, selectors.EVENT_READ, None)
+
+    def addTap(self, tap):
+        # tap(time, direction, flow, data) sees every relayed datagram,
+        #   direction is "up" (client to upstream) or "down"
+        self.taps.append(tap)
+
+    def getFlow(self, listener, client, now):
+        # the flow of client, opened if needed, and marked as the most recent.
+        #   Raises OSError if no socket can be opened for it.
+        key = (listener, client)
+        flow = self.flows.get(key)
+        if flow is not None:
+            self.flows.move_to_end(key)
+            return flow
+        while len(self.flows) >= self.maxFlows:
+            self.closeFlow(next(iter(self.flows)))
+            self.counters["flows_evicted"] += 1
+        flow = Flow(client, listener, self.listeners[listener], now)
+        self.flows[key] = flow
+        self.selector.register(flow.socket, selectors.EVENT_READ, flow)
+        self.counters["flows_opened"] += 1
+        logger.info("new flow %s:%d -> %s:%d", client[0], client[1], *flow.upstream)
+        return flow
+
+    def closeFlow(self, key):
+        flow = self.flows.pop(key)
+        self.selector.unregister(flow.socket)
+        flow.close()
+
+    def forward(self, listener):
+        # client to upstream
+        try:
+            data, client = listener.recvfrom(MAX_DATAGRAM)
+        except (BlockingIOError, ConnectionRefusedError):
+            return
+        except OSError as e:
+            logger.warning("receive from clients failed: %s", e)
+            with self.lock:
+                self.counters["socket_errors"] += 1
+            return
+        now = time.monotonic()
+        with self.lock:
+            try:
+                flow = self.getFlow(listener, client, now)
+            except OSError as e:
+                # out of file descriptors, most likely
+                logger.warning("no flow for %s:%d: %s", client[0], client[1], e)
+                self.counters["socket_errors"] += 1
+                self.counters["dropped_up"] += 1
+                return
+            flow.lastActive = now
+            self.counters["packets_up"] += 1
+            self.counters["bytes_up"] += len(data)
+        logger.debug("%s:%d -> upstream: %r", client[0], client[1], data)
+        for tap in self.taps:
+            tap(time.time(), "up", flow, data)
+        try:
+            flow.socket.send(data)
+            flow.pending.append(now)
+        except (BlockingIOError, ConnectionRefusedError):
+            with self.lock:
+                self.counters["dropped_up"] += 1
+        except OSError as e:
+            logger.warning("send to %s:%d failed: %s", *flow.upstream, e)
+            with self.lock:
+                self.counters["socket_errors"] += 1
+                self.counters["dropped_up"] += 1
+
+    def reply(self, flow):
+        # upstream to client
+        try:
+            data = flow.socket.recv(MAX_DATAGRAM)
+        except BlockingIOError:
+            return
+        except ConnectionRefusedError:
+            # ICMP port unreachable from an earlier send, the upstream is down
+            with self.lock:
+                self.counters["upstream_refused"] += 1
+            return
+        except OSError as e:
+            logger.warning("receive from %s:%d failed: %s", *flow.upstream, e)
+            with self.lock:
+                self.counters["socket_errors"] += 1
+            return
+        now = time.monotonic()
+        with self.lock:
+            flow.lastActive = now
+            key = (flow.listener, flow.client)
+            if self.flows.get(key) is flow:
+                self.flows.move_to_end(key)
+            self.counters["packets_down"] += 1
+            self.counters["bytes_down"] += len(data)
+            if flow.pending:
+                self.latency.observe(now - flow.pending.popleft())
+            else:
+                self.counters["unsolicited_down"] += 1
+        logger.debug("upstream -> %s:%d: %r", flow.client[0], flow.client[1], data)
+        for tap in self.taps:
+            tap(time.time(), "down", flow, data)
+        try:
+            flow.listener.sendto(data, flow.client)
+        except (BlockingIOError, ConnectionRefusedError):
+            with self.lock:
+                self.counters["dropped_down"] += 1
+        except OSError as e:
+            logger.warning("send to %s:%d failed: %s", flow.client[0], flow.client[1], e)
+            with self.lock:
+                self.counters["socket_errors"] += 1
+                self.counters["dropped_down"] += 1
+
+    def expire(self, now):
+        # close idle flows and give up on requests that will never be answered
+        with self.lock:
+            for key, flow in list(self.flows.items()):
+                while flow.pending and now - flow.pending[0] > self.latencyTimeout:
+                    flow.pending.popleft()
+                    self.counters["unanswered"] += 1
+                if now - flow.lastActive > self.idleTimeout:
+                    self.closeFlow(key)
+                    self.counters["flows_expired"] += 1
+
+    def runOnce(self, timeout=1.0):
+        for key, events in self.selector.select(timeout):
+            if key.data is None:
+                self.forward(key.fileobj)
+            else:
+                self.reply(key.data)
+
+    def run(self):
+        nextExpire = time.monotonic() + 1
+        while True:
+            self.runOnce(1.0)
+            now = time.monotonic()
+            if now >= nextExpire:
+                self.expire(now)
+                nextExpire = now + 1
+
+    def getStats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["flows_active"] = len(self.flows)
+            stats["latency"] = self.latency.summary()
+        return stats
+
+
+def parseRoute(text):
+    # "23459=127.0.0.1:23456" -> (23459, ("127.0.0.1", 23456))
+    port, upstream = text.split("=")
+    host, upstreamPort = upstream.rsplit(":", 1)
+    return int(port), (host, int(upstreamPort))
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="UDP relay between clients and thermometers.")
+    argParser.add_argument("--route", action="append", type=parseRoute,
+                           help="localport=host:port, repeat for more upstreams (default 23459=127.0.0.1:23456)")
+    argParser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    argParser.add_argument("--idle", type=float, default=60, help="seconds before an idle flow is closed")
+    argParser.add_argument("--max-flows", type=int, default=1024,
+                           help="open flows at most, the least recently active one is closed for a new client")
+    argParser.add_argument("--stats", type=float, default=10, help="seconds between stats lines, 0 for none")
+    argParser.add_argument("--verbose", action="store_true", help="log every relayed datagram")
+    args = argParser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    relay = UdpRelay(dict(args.route or [parseRoute("23459=127.0.0.1:23456")]), args.host, args.idle,
+                     maxFlows=args.max_flows)
+    relay.start()
+    while True:
+        time.sleep(args.stats or 3600)
+        if args.stats:
+            logger.info("stats %s", relay.getStats())
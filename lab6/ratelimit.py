@@ -0,0 +1,64 @@
+import collections
+import time
+
+# (requests per second, burst) per source address and command class
+DEFAULT_RATE_LIMITS = {
+    "datagram": (500, 200),  # everything, checked before decrypting
+    "auth": (2, 10),         # AUTH mints a token, the most expensive command
+    "control": (20, 40),     # SET_DEG*, UPDATE_TEMP, (UN)SUBSCRIBE, LOGOUT, STATS
+    "read": (200, 100),      # GET_TEMP, GET_HISTORY
+    "error": (5, 10),        # Bad Token / Bad Command / Authenticate First / Invalid Command
+}
+
+
+class TokenBucket:
+    """Allows rate requests per second on average and up to burst at once."""
+
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """Token buckets per (source address, class).
+
+    limits maps a class name to (rate, burst); classes without a limit are
+    always allowed. At most maxBuckets buckets are kept, the least recently
+    used one is dropped to make room (that source starts over with a full
+    bucket), so a flood from many spoofed addresses costs bounded memory.
+    """
+
+    def __init__(self, limits=None, maxBuckets=10000, clock=time.monotonic):
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self.maxBuckets = maxBuckets
+        self.clock = clock
+        self.buckets = collections.OrderedDict()  # (source, class) -> TokenBucket
+        self.evictions = 0
+
+    def allow(self, source, kind):
+        limit = self.limits.get(kind)
+        if limit is None:
+            return True
+        now = self.clock()
+        key = (source, kind)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            while len(self.buckets) >= self.maxBuckets:
+                self.buckets.popitem(last=False)
+                self.evictions += 1
+            bucket = self.buckets[key] = TokenBucket(limit[0], limit[1], now)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket.take(now)
@@ -0,0 +1,51 @@
+import collections
+
+# share of each serving round per class, in priority order
+DEFAULT_SHARES = {
+    "read": 0.7,     # authenticated GET_TEMP / GET_HISTORY
+    "session": 0.2,  # AUTH, LOGOUT, unit changes, subscriptions, STATS
+    "error": 0.1,    # requests that only get an error reply
+}
+
+
+class PriorityScheduler:
+    """Bounded FIFO queues per request class served by weighted shares.
+
+    Each call to take(budget) first gives every class up to its share of the
+    budget, in priority order (the order of shares), then hands whatever is
+    left to the classes in the same order. A class with work waiting therefore
+    always gets its share, however busy the classes before it are, and no slot
+    goes unused while anything is queued. Queues hold at most maxQueue
+    requests; push() refuses more.
+    """
+
+    def __init__(self, shares=None, maxQueue=256):
+        self.shares = dict(DEFAULT_SHARES if shares is None else shares)
+        self.maxQueue = maxQueue
+        self.queues = collections.OrderedDict((kind, collections.deque()) for kind in self.shares)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def push(self, kind, item):
+        queue = self.queues[kind]
+        if len(queue) >= self.maxQueue:
+            return False
+        queue.append(item)
+        return True
+
+    def take(self, budget):
+        # [(kind, item), ...] to serve this round, highest priority first
+        served = collections.OrderedDict((kind, []) for kind in self.queues)
+        left = budget
+        for kind, queue in self.queues.items():
+            share = self.shares[kind]
+            quota = max(1, int(share * budget)) if share > 0 else 0
+            for i in range(min(len(queue), quota, left)):
+                served[kind].append(queue.popleft())
+                left -= 1
+        for kind, queue in self.queues.items():
+            while queue and left > 0:
+                served[kind].append(queue.popleft())
+                left -= 1
+        return [(kind, item) for kind, items in served.items() for item in items]
@@ -0,0 +1,66 @@
+import bisect
+import collections
+import json
+
+
+class LatencyHistogram:
+    """Log scale latency histogram, bucket i counts latencies up to 2**i us."""
+
+    BOUNDS = [1e-6 * 2 ** i for i in range(25)]  # 1 us to about 17 s
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)  # last one is overflow
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th percentile
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50), "p99": self.percentile(99), "max": self.max}
+
+
+class ServerStats:
+    """Counters and latency histograms for a SmartNetworkThermometer.
+
+    Only touched from the thread serving the socket, so there is no locking.
+    """
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(LatencyHistogram)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds)
+
+    def report(self, extra=None):
+        data = {"counters": dict(self.counters),
+                "latency": {name: h.summary() for name, h in sorted(self.histograms.items())}}
+        if extra:
+            data.update(extra)
+        return data
+
+    def toJson(self, extra=None):
+        # a single line, so it fits the one line per command BATCH framing
+        return json.dumps(self.report(extra), separators=(",", ":"))
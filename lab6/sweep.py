@@ -0,0 +1,180 @@
+import argparse
+import csv
+import itertools
+import math
+import multiprocessing
+import random
+import sys
+
+import infinc
+
+# every parameter a sweep can vary, with the values the sample setup uses
+DEFAULTS = {
+    "infMass": 8.0,                # kg
+    "infLength": 1.68,             # m
+    "infTemp": 36 + 273.0,         # degK
+    "incWidth": 1.0,               # m
+    "incDepth": 1.0,               # m
+    "incHeight": 1.0,              # m
+    "incTemp": 37 + 273.0,         # degK
+    "roomTemp": 20 + 273.0,        # degK
+    "heaterPower": 1500.0,         # W
+    "heaterSetTemp": 45 + 273.0,   # degK
+    "heaterPeriod": 0.5,           # s between thermostat polls
+}
+METRICS = ["timeToTarget", "overshoot", "infantMin", "infantMax", "infantFinal", "incubatorMin", "incubatorMax",
+           "incubatorFinal"]
+
+
+def grid(**axes):
+    """Every combination of the given values, e.g. grid(heaterPower=[1000, 1500], roomTemp=[283, 293])."""
+    names = list(axes)
+    return [dict(DEFAULTS, **dict(zip(names, values))) for values in itertools.product(*axes.values())]
+
+
+def sample(count, seed=None, **ranges):
+    """count configurations drawn uniformly from the given (low, high) ranges."""
+    rng = random.Random(seed)
+    return [dict(DEFAULTS, **{name: rng.uniform(low, high) for name, (low, high) in ranges.items()})
+            for i in range(count)]
+
+
+class Tracker:
+    """Simulator recorder that keeps the METRICS up to date on every step.
+
+    The incubator reaches level when it first gets there; the time is
+    interpolated between the two steps around the crossing.
+    """
+
+    def __init__(self, level, infant, incubator):
+        self.level = level
+        self.reached = 0.0 if incubator >= level else None
+        self.peak = incubator if self.reached is not None else None
+        self.infantMin = self.infantMax = self.infantFinal = infant
+        self.incubatorMin = self.incubatorMax = self.incubatorFinal = incubator
+        self.last = 0.0
+
+    def record(self, t, device, infant, incubator, heater):
+        if infant < self.infantMin:
+            self.infantMin = infant
+        elif infant > self.infantMax:
+            self.infantMax = infant
+        if incubator < self.incubatorMin:
+            self.incubatorMin = incubator
+        elif incubator > self.incubatorMax:
+            self.incubatorMax = incubator
+        if self.reached is None and incubator >= self.level:
+            previous = self.incubatorFinal
+            self.reached = self.last + (self.level - previous) / (incubator - previous) * (t - self.last)
+            self.peak = incubator
+        elif self.reached is not None and incubator > self.peak:
+            self.peak = incubator
+        self.infantFinal = infant
+        self.incubatorFinal = incubator
+        self.last = t
+
+
+def simulate(params, duration=4 * 3600, timeStep=0.1, tolerance=0.5, integrator="exact"):
+    """Runs one configuration without sleeping and returns params plus METRICS.
+
+    The incubator reaches its target when it first comes within tolerance degK
+    of heaterSetTemp; overshoot is how far it then goes past heaterSetTemp.
+    The metrics are updated after every integration step. The exact integrator
+    is made to step poll by poll instead of jumping between heater switches,
+    so nothing between two thermostat polls goes unseen.
+    """
+    p = dict(DEFAULTS, **params)
+    bob = infinc.Human(mass=p["infMass"], length=p["infLength"], temperature=p["infTemp"])
+    inc = infinc.Incubator(width=p["incWidth"], depth=p["incDepth"], height=p["incHeight"],
+                           temperature=p["incTemp"], roomTemperature=p["roomTemp"])
+    inc.addInfant(bob)
+    clock = infinc.VirtualClock()
+    thermometer = infinc.SmartThermometer(inc, p["heaterPeriod"])
+    heater = infinc.SmartHeater(powerOutput=p["heaterPower"], setTemperature=p["heaterSetTemp"],
+                                thermometer=thermometer, updatePeriod=p["heaterPeriod"])
+    clock.register(thermometer)
+    clock.register(heater)
+    inc.setHeater(heater)
+    sim = infinc.Simulator(infant=bob, incubator=inc, roomTemp=p["roomTemp"], timeStep=timeStep, sleepTime=0,
+                           clock=clock, integrator=integrator)
+
+    # a jump over a warm-up could pass the crossing and the infant's turning point
+    sim.quietPolls = math.inf
+
+    target = p["heaterSetTemp"]
+    tracker = Tracker(target - tolerance, bob.getTemperature(), inc.getTemperature())
+    sim.setRecorder(tracker, 0)
+    sim.fastForward(duration)
+
+    p.update({
+        "timeToTarget": tracker.reached,
+        "overshoot": max(tracker.peak - target, 0.0) if tracker.peak is not None else None,
+        "infantMin": tracker.infantMin,
+        "infantMax": tracker.infantMax,
+        "infantFinal": tracker.infantFinal,
+        "incubatorMin": tracker.incubatorMin,
+        "incubatorMax": tracker.incubatorMax,
+        "incubatorFinal": tracker.incubatorFinal,
+    })
+    return p
+
+
+def _simulate(args):
+    # Pool.imap passes a single argument
+    params, options = args
+    return simulate(params, **options)
+
+
+def runSweep(configs, processes=None, **options):
+    """Runs simulate() on every configuration across a process pool and
+    returns the result rows in the order of configs. options are passed on
+    to simulate()."""
+    with multiprocessing.Pool(processes) as pool:
+        chunk = max(1, len(configs) // ((processes or multiprocessing.cpu_count()) * 4))
+        return list(pool.imap(_simulate, [(c, options) for c in configs], chunksize=chunk))
+
+
+def writeTable(rows, out):
+    # one CSV row per configuration, parameters first then metrics
+    writer = csv.DictWriter(out, fieldnames=list(DEFAULTS) + METRICS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def parseAxes(specs, ranges):
+    # "heaterPower=1000,1500" for a grid, "heaterPower=1000:3000" for a random range
+    axes = {}
+    for spec in specs:
+        name, values = spec.split("=")
+        if name not in DEFAULTS:
+            raise ValueError("unknown parameter %s, expected one of %s" % (name, ", ".join(DEFAULTS)))
+        if ranges:
+            low, high = values.split(":")
+            axes[name] = (float(low), float(high))
+        else:
+            axes[name] = [float(v) for v in values.split(",")]
+    return axes
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Parameter sweeps over simulated incubators.",
+                                        epilog="parameters: " + ", ".join(DEFAULTS))
+    argParser.add_argument("params", nargs="*",
+                           help="name=v1,v2,... for a grid, or name=low:high with --samples")
+    argParser.add_argument("--samples", type=int, help="draw this many random configurations instead of a grid")
+    argParser.add_argument("--seed", type=int, default=None)
+    argParser.add_argument("--duration", type=float, default=4 * 3600, help="simulated seconds per run")
+    argParser.add_argument("--tolerance", type=float, default=0.5, help="degK from the set point counted as reached")
+    argParser.add_argument("--integrator", choices=["exact", "euler"], default="exact")
+    argParser.add_argument("--processes", type=int, default=None, help="pool size, all cores by default")
+    argParser.add_argument("--output", help="CSV file to write, stdout by default")
+    args = argParser.parse_args()
+
+    axes = parseAxes(args.params, args.samples is not None)
+    configs = sample(args.samples, args.seed, **axes) if args.samples is not None else grid(**axes)
+    rows = runSweep(configs, args.processes, duration=args.duration, tolerance=args.tolerance, integrator=args.integrator)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writeTable(rows, f)
+    else:
+        writeTable(rows, sys.stdout)
@@ -0,0 +1,120 @@
+import math
+import os
+import struct
+import threading
+
+import numpy as np
+
+# One fixed width little endian record, the same layout in memory and on disk
+RECORD = np.dtype([("time", "<f8"), ("device", "<u4"), ("infant", "<f4"), ("incubator", "<f4"), ("heater", "<f4")])
+PACKER = struct.Struct("<dIfff")
+SEGMENT_SUFFIX = ".tlm"
+
+
+class TelemetryRecorder:
+    """Append-only binary log of simulator and thermometer readings.
+
+    Records are RECORD sized and written to numbered segment files in
+    directory, a new segment starting every segmentRecords records. Values a
+    source doesn't know (e.g. the heater output for a thermometer) are NaN.
+    Safe to share between threads.
+    """
+
+    def __init__(self, directory, segmentRecords=1 << 20, flushRecords=256):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segmentRecords = segmentRecords
+        self.flushRecords = flushRecords
+        self.lock = threading.Lock()
+        self.pending = []
+        self.file = None
+        self.segmentCount = 0  # records in the current segment
+        existing = listSegments(directory)
+        self.segment = int(os.path.basename(existing[-1])[:-len(SEGMENT_SUFFIX)]) + 1 if existing else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, t, device, infant=math.nan, incubator=math.nan, heater=math.nan):
+        with self.lock:
+            self.pending.append(PACKER.pack(t, device, infant, incubator, heater))
+            if len(self.pending) >= self.flushRecords:
+                self.writePending()
+
+    def writePending(self):
+        # called with the lock held
+        for data in self.pending:
+            if self.file is None or self.segmentCount >= self.segmentRecords:
+                self.openSegment()
+            self.file.write(data)
+            self.segmentCount += 1
+        self.pending = []
+        if self.file is not None:
+            self.file.flush()
+
+    def openSegment(self):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.directory, "%08d%s" % (self.segment, SEGMENT_SUFFIX))
+        self.file = open(path, "ab")
+        self.segment += 1
+        self.segmentCount = 0
+
+    def flush(self):
+        with self.lock:
+            self.writePending()
+
+    def close(self):
+        with self.lock:
+            self.writePending()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def listSegments(directory):
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(SEGMENT_SUFFIX))
+
+
+class TelemetryReader:
+    """Reads a TelemetryRecorder directory through memory maps.
+
+    Nothing is parsed, each segment is mapped straight into a numpy record
+    array. A partially written last record is ignored.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        maps = []
+        for path in listSegments(self.directory):
+            count = os.path.getsize(path) // RECORD.itemsize
+            if count:
+                maps.append(np.memmap(path, dtype=RECORD, mode="r", shape=(count,)))
+        return maps
+
+    def read(self, start=None, end=None, device=None):
+        # Records with start <= time < end (and from device, if given), as one
+        # array. Whole segments outside the time range are skipped.
+        parts = []
+        for records in self.segments():
+            times = records["time"]
+            if start is not None and times[-1] < start:
+                continue
+            if end is not None and times[0] >= end:
+                continue
+            mask = np.ones(len(records), dtype=bool)
+            if start is not None:
+                mask &= times >= start
+            if end is not None:
+                mask &= times < end
+            if device is not None:
+                mask &= records["device"] == device
+            parts.append(records[mask])
+        if not parts:
+            return np.zeros(0, dtype=RECORD)
+        return np.concatenate(parts)
@@ -0,0 +1,517 @@
+"""Network thermometer library, no GUI and no side effects on import.
+
+Importing this module only loads the standard library; cryptography is
+loaded when the first datagram arrives and asyncio only for useAsyncio, so
+a headless device starts quickly. See device.py for a headless entry point
+and SampleNetworkServer.py for the GUI demo.
+"""
+import fcntl
+import functools
+import hashlib
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+from history import RingBuffer
+from ratelimit import DEFAULT_RATE_LIMITS, RateLimiter
+from scheduler import DEFAULT_SHARES, PriorityScheduler
+from serverstats import ServerStats
+from tokenstore import TokenStore
+
+logger = logging.getLogger(__name__)
+
+PASSWORD = None
+UPDATE_PERIOD = .05  # in seconds
+SIMULATION_STEP = .1  # in seconds
+MAX_DATAGRAM = 65535  # batched requests can be larger than a single command
+HISTORY_LIMIT = 1000  # most samples sent in one GET_HISTORY reply
+DRAIN_LIMIT = 256  # most datagrams read from the socket per serving round
+# kernel receive timestamps, older Pythons don't name the constant
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else None)
+
+
+class Subscription:
+    def __init__(self, token, interval, deadband, expires, seal):
+        self.token = token
+        self.seal = seal  # encrypts pushes the same way as the SUBSCRIBE came in
+        self.interval = interval  # minimum seconds between pushes
+        self.deadband = deadband  # degK, only push changes larger than this
+        self.expires = expires  # the client has to renew before this
+        self.lastSent = None
+        self.lastValue = None
+
+
+class SmartNetworkThermometer(threading.Thread):
+    open_cmds = ["AUTH", "LOGOUT"]
+    prot_cmds = ["SET_DEGF", "SET_DEGC", "SET_DEGK", "GET_TEMP", "UPDATE_TEMP", "SUBSCRIBE", "UNSUBSCRIBE", "GET_HISTORY",
+                 "STATS"]
+    subscriptionLease = 60  # seconds a SUBSCRIBE lasts without being renewed
+    # rate limiting class of each command, unknown commands are "error"
+    commandClasses = {"AUTH": "auth", "GET_TEMP": "read", "GET_HISTORY": "read", "LOGOUT": "control",
+                      "SET_DEGF": "control", "SET_DEGC": "control", "SET_DEGK": "control", "UPDATE_TEMP": "control",
+                      "SUBSCRIBE": "control", "UNSUBSCRIBE": "control", "STATS": "control"}
+
+    def __init__(self, source, updatePeriod, port, password, key, useAsyncio=False, tokens=None,
+                 historySize=12000, rateLimits=DEFAULT_RATE_LIMITS, shares=DEFAULT_SHARES, servePerRound=64,
+                 maxQueue=256):  # Added password as parameter.
+        threading.Thread.__init__(self, daemon=True)
+        # set daemon to be true, so it doesn't block program from exiting
+        self.source = source
+        self.updatePeriod = updatePeriod
+        self.curTemperature = 0
+        self.history = RingBuffer(historySize)  # 10 minutes at the default 20 Hz
+        self.recorder = None  # telemetry.TelemetryRecorder
+        self.updateTemperature()
+        self.tokens = tokens if tokens is not None else TokenStore()  # bounded, expiring token store
+        self.key = key  # Fernet key, AEAD session keys are derived from it too
+        self._crypto = None  # Fernet, created on first use, see crypto
+        self.hashed_password = hashlib.sha256(bytes(password, "utf-8")).hexdigest()  # store hashed password
+        #print(self.hashed_password)
+        #self.serverSocket = socket.create_server(address=("127.0.0.1", port), reuse_port=True, family=socket.AF_INET)
+        self.serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.serverSocket.bind(("127.0.0.1", port))
+        self.port = port
+        fcntl.fcntl(self.serverSocket, fcntl.F_SETFL, os.O_NONBLOCK)
+        if SO_TIMESTAMPNS is not None:  # kernel arrival times for queue wait stats
+            self.serverSocket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+
+        self.deg = "K"
+        self.useAsyncio = useAsyncio  # serve with an asyncio event loop instead of polling
+        self.transport = None
+        self.subscriptions = {}  # addr -> Subscription
+        self.stats = ServerStats()
+        # per source address token buckets, see ratelimit.py, None turns them off
+        self.limiter = RateLimiter(rateLimits) if rateLimits is not None else None
+        # polling mode queues requests by priority class, see scheduler.py
+        self.scheduler = PriorityScheduler(shares, maxQueue)
+        self.servePerRound = servePerRound
+
+    @property
+    def crypto(self):
+        # importing cryptography takes longer than starting the thermometer,
+        #   so it waits for the first datagram
+        if self._crypto is None:
+            import cryptography.fernet
+            self._crypto = cryptography.fernet.Fernet(key=self.key)
+        return self._crypto
+
+    def setPassword(self, password):
+        self.hashed_password = hashlib.sha256(password).hexdigest()
+
+    def setSource(self, source):
+        self.source = source
+
+    def setUpdatePeriod(self, updatePeriod):
+        self.updatePeriod = updatePeriod
+
+    def setDegreeUnit(self, s):
+        self.deg = s
+        if self.deg not in ["F", "K", "C"]:
+            self.deg = "K"
+
+    def updateTemperature(self):
+        if self.source is not None:
+            self.curTemperature = self.source.getTemperature()
+            now = time.time()
+            self.history.append(now, self.curTemperature)
+            if self.recorder is not None:
+                self.recorder.record(now, self.recordDevice, **{self.recordField: self.curTemperature})
+
+    def setRecorder(self, recorder, device, field="infant"):
+        # log every reading to recorder, field is "infant" or "incubator"
+        self.recorder = recorder
+        self.recordDevice = device
+        self.recordField = field
+
+    def tick(self):  # one update, used by infinc.VirtualClock and the serving loops
+        self.updateTemperature()
+        self.pushUpdates()
+
+    def pushUpdates(self):
+        # Sends the current temperature to subscribers that are due for one
+        if not self.subscriptions:
+            return
+        now = time.monotonic()
+        for addr, sub in list(self.subscriptions.items()):
+            if now > sub.expires:
+                del self.subscriptions[addr]
+                continue
+            if sub.lastSent is not None:
+                if now - sub.lastSent < sub.interval:
+                    continue
+                if sub.deadband > 0 and abs(self.curTemperature - sub.lastValue) <= sub.deadband:
+                    continue
+            self.sendto(self.encrypt(b"PUSH %f\n" % self.getTemperature(), sub.seal), addr)
+            sub.lastSent = now
+            sub.lastValue = self.curTemperature
+
+    def getHistory(self, args):
+        # GET_HISTORY:<since>[:<limit>], since is a unix timestamp. The reply
+        # is one line: the first sample's timestamp followed by
+        # "<seconds after it>,<temperature>" pairs, oldest first. A reply
+        # with limit samples may have more, ask again from its last timestamp.
+        # Times are sent in full (repr) precision: t - start is exact for
+        # timestamps this close together, so start + offset gives back the
+        # stored timestamp and paging from it never repeats a sample.
+        try:
+            since = float(args[0])
+            limit = int(args[1]) if len(args) > 1 else HISTORY_LIMIT
+        except (IndexError, ValueError):
+            return b"Invalid Command\n"
+        times, values = self.history.since(since, min(max(limit, 0), HISTORY_LIMIT))
+        if len(times) == 0:
+            return b"\n"
+        start = times[0]
+        samples = " ".join("%r,%f" % (t - start, self.convertTemperature(v)) for t, v in zip(times, values))
+        return ("%r %s\n" % (start, samples)).encode("utf-8")
+
+    def subscribe(self, args, addr, token, seal):
+        # SUBSCRIBE:<interval>[:<deadband>], renewing replaces the old settings
+        try:
+            interval = float(args[0])
+            deadband = float(args[1]) if len(args) > 1 else 0.0
+        except (IndexError, ValueError):
+            return b"Invalid Command\n"
+        if len(args) > 2 or interval < 0 or deadband < 0 or token is None:
+            return b"Invalid Command\n"
+        old = self.subscriptions.get(addr)
+        sub = Subscription(token, interval, deadband, time.monotonic() + self.subscriptionLease, seal)
+        if old is not None and old.token == token:
+            sub.lastSent, sub.lastValue = old.lastSent, old.lastValue
+        self.subscriptions[addr] = sub
+        return b"OK\n"
+
+    def getTemperature(self):
+        return self.convertTemperature(self.curTemperature)
+
+    def convertTemperature(self, kelvin):
+        # converts to the currently selected unit
+        if self.deg == "C":
+            return kelvin - 273
+        if self.deg == "F":
+            return (kelvin - 273) * 9 / 5 + 32
+
+        return kelvin
+
+    def processCommands(self, msg, addr, token=None, seal=None):
+        # seal encrypts the replies, Fernet unless the request was an AEAD frame
+        logger.debug("commands from %s: %s", addr, msg)
+        seal = seal or self.crypto.encrypt
+        cmds = msg.split(';')
+        # a datagram costs one token from each class it has commands in, and
+        # is dropped without a reply if any of them is out of tokens
+        for kind in {self.commandClass(c) for c in cmds if c and c != "BATCH"}:
+            if not self.admit(addr, kind):
+                return
+        if cmds[0] == "BATCH":
+            # batched form: every command gets exactly one reply line and all
+            # of them go back in a single datagram, in command order
+            self.stats.count("BATCH")
+            replies = [self.timedCommand(c, addr, token, seal) or b"OK\n" for c in cmds[1:] if c]
+            self.sendto(self.encrypt(b"".join(replies), seal), addr)
+            return
+        for c in cmds:
+            reply = self.timedCommand(c, addr, token, seal)
+            if reply is not None:
+                self.sendto(self.encrypt(reply, seal), addr)
+
+    def commandName(self, c):
+        # the name commands are counted under, a fixed set so stats stay small
+        name = c.split(' ')[0].split(':')[0]
+        return name if name in self.open_cmds or name in self.prot_cmds else "INVALID"
+
+    def commandClass(self, c):
+        return self.commandClasses.get(self.commandName(c), "error")
+
+    def priorityClass(self, msg):
+        # "read" if every command in msg is a read, "session" otherwise
+        cmds = [c for c in msg.split(';') if c and c != "BATCH"]
+        if cmds and all(self.commandClass(c) == "read" for c in cmds):
+            return "read"
+        return "session"
+
+    def admit(self, addr, kind):
+        # False if addr has used up its budget for this class of request
+        if self.limiter is None or self.limiter.allow(addr[0], kind):
+            return True
+        self.stats.count("shed_" + kind)
+        return False
+
+    def replyError(self, addr, counter, reply, seal=None):
+        # error replies cost an encryption too, so they have their own budget
+        self.stats.count(counter)
+        if self.admit(addr, "error"):
+            self.sendto(self.encrypt(reply, seal), addr)
+
+    def timedCommand(self, c, addr, token, seal):
+        if not c:
+            return None
+        start = time.perf_counter()
+        name = self.commandName(c)
+        if token is None and name in self.prot_cmds:
+            # commands riding along with AUTH / LOGOUT have no session
+            self.stats.count("authenticate_first")
+            reply = b"Authenticate First\n"
+        else:
+            reply = self.runCommand(c, addr, token, seal)
+        self.stats.count(name)
+        self.stats.observe(name, time.perf_counter() - start)
+        return reply
+
+    def encrypt(self, data, seal=None):
+        start = time.perf_counter()
+        data = (seal or self.crypto.encrypt)(data)
+        self.stats.observe("encrypt", time.perf_counter() - start)
+        return data
+
+    def runCommand(self, c, addr=None, token=None, seal=None):
+        # Runs one command and returns the reply, or None if there isn't one.
+        # token is the session token the command arrived with, if any.
+        cs = c.split(' ')
+        if len(cs) == 2:  # should be either AUTH or LOGOUT
+            if cs[0] == "AUTH":
+                if cs[1] == self.hashed_password:
+                    # the store evicts the least recently used token when full
+                    return self.tokens.issue().encode('utf-8')
+                self.stats.count("auth_failed")
+            elif cs[0] == "LOGOUT":
+                self.tokens.remove(cs[1])
+                for subAddr, sub in list(self.subscriptions.items()):
+                    if sub.token == cs[1]:
+                        del self.subscriptions[subAddr]
+            else:  # unknown command
+                return b"Invalid Command\n"
+        elif c == "SET_DEGF":
+            self.deg = "F"
+        elif c == "SET_DEGC":
+            self.deg = "C"
+        elif c == "SET_DEGK":
+            self.deg = "K"
+        elif c == "GET_TEMP":
+            return b"%f\n" % self.getTemperature()
+        elif c == "UPDATE_TEMP":
+            self.updateTemperature()
+        elif c.startswith("SUBSCRIBE:"):
+            return self.subscribe(c.split(':')[1:], addr, token, seal or self.crypto.encrypt)
+        elif c == "STATS":
+            return self.stats.toJson({"tokens": self.tokens.getStats()}).encode("utf-8") + b"\n"
+        elif c.startswith("GET_HISTORY:"):
+            return self.getHistory(c.split(':')[1:])
+        elif c == "UNSUBSCRIBE":
+            self.subscriptions.pop(addr, None)
+            return b"OK\n"
+        elif c:
+            return b"Invalid Command\n"
+        return None
+
+    def sendto(self, msg, addr):
+        if self.transport is not None:
+            self.transport.sendto(msg, addr)
+        else:
+            self.serverSocket.sendto(msg, addr)
+
+    def getChannel(self, token, version):
+        # AEAD channels are cached with the token so they expire with it
+        import aead
+        channels = self.tokens.getData(token)
+        if channels is None:
+            channels = {}
+            self.tokens.setData(token, channels)
+        if version not in channels:
+            channels[version] = aead.AeadChannel(self.key, token, version)
+        return channels[version]
+
+    def parseFrame(self, frame, addr):
+        # compact AEAD wire mode, see aead.py
+        import aead
+        import cryptography.exceptions
+        token = aead.frameToken(frame)
+        if token is None:
+            self.stats.count("dropped")
+            return None  # too short to be a request frame
+        if token not in self.tokens:
+            # the token is in the clear, so the decryption only an error
+            #   reply needs can wait behind the valid requests
+            return "error", functools.partial(self.rejectFrame, frame, addr, token)
+        channel = self.getChannel(token, frame[0])
+        start = time.perf_counter()
+        try:
+            msg = channel.openRequest(frame).decode("utf-8").strip()
+        except (cryptography.exceptions.InvalidTag, ValueError):
+            self.stats.count("dropped")
+            return None  # forged or corrupted, drop it
+        self.stats.observe("decrypt", time.perf_counter() - start)
+        return self.priorityClass(msg), functools.partial(self.processCommands, msg, addr, token, channel.sealReply)
+
+    def rejectFrame(self, frame, addr, token):
+        # Bad Token for an AEAD frame, which has to be decrypted first to
+        #   know it isn't forged
+        import aead
+        import cryptography.exceptions
+        # an unknown token can be turned away before paying for key
+        #   derivation and decryption
+        if not self.admit(addr, "error"):
+            return
+        # channels for unknown tokens aren't cached, they would outlive nothing
+        channel = aead.AeadChannel(self.key, token, frame[0])
+        start = time.perf_counter()
+        try:
+            channel.openRequest(frame)
+        except (cryptography.exceptions.InvalidTag, ValueError):
+            self.stats.count("dropped")
+            return
+        self.stats.observe("decrypt", time.perf_counter() - start)
+        self.stats.count("bad_token")
+        self.sendto(self.encrypt(b"Bad Token\n", channel.sealReply), addr)
+
+    def parseDatagram(self, msg, addr, received=None):
+        # Decrypts a datagram and returns (priority class, action), where
+        # action() answers it, or None if it is dropped. received is when the
+        # datagram arrived, if known, to measure queue wait.
+        import aead  # these load cryptography, so they wait for the first datagram
+        from cryptography.fernet import InvalidToken
+        self.stats.count("datagrams")
+        if received is not None:
+            self.stats.observe("queue", max(0.0, time.time() - received))
+        if not self.admit(addr, "datagram"):
+            return None  # over the per address budget, drop before any crypto
+        if aead.isFrame(msg):
+            return self.parseFrame(msg, addr)
+        crypto = self.crypto
+        start = time.perf_counter()
+        try:
+            msg = crypto.decrypt(msg)
+            msg = msg.decode("utf-8").strip()
+        except (InvalidToken, UnicodeDecodeError):
+            self.stats.count("dropped")
+            return None  # drop datagrams we can't decrypt
+        self.stats.observe("decrypt", time.perf_counter() - start)
+        cmds = msg.split(' ')
+        if len(cmds) == 1:  # protected commands case
+            semi = msg.find(';')
+            if semi != -1:  # if we found the semicolon
+                if msg[:semi] in self.tokens:  # if its a valid token
+                    return (self.priorityClass(msg[semi + 1:]),
+                            functools.partial(self.processCommands, msg[semi + 1:], addr, msg[:semi]))
+                return "error", functools.partial(self.replyError, addr, "bad_token", b"Bad Token\n")
+            return "error", functools.partial(self.replyError, addr, "bad_command", b"Bad Command\n")
+        elif len(cmds) == 2:
+            if cmds[0] in self.open_cmds:  # if its AUTH or LOGOUT
+                return "session", functools.partial(self.processCommands, msg, addr)
+            return "error", functools.partial(self.replyError, addr, "authenticate_first", b"Authenticate First\n")
+        # otherwise bad command
+        return "error", functools.partial(self.replyError, addr, "bad_command", b"Bad Command\n")
+
+    def handleDatagram(self, msg, addr, received=None):
+        # answers a datagram straight away, without queueing it
+        parsed = self.parseDatagram(msg, addr, received)
+        if parsed is not None:
+            parsed[1]()
+
+    def drain(self):
+        # receive stage: reads what is waiting on the socket into the
+        #   scheduler's queues, a full queue sheds the request
+        for i in range(DRAIN_LIMIT):
+            try:
+                msg, addr, received = self.receive()
+            except BlockingIOError:
+                return
+            except IOError:
+                continue  # e.g. an ICMP error from an earlier reply
+            try:
+                parsed = self.parseDatagram(msg, addr, received)
+            except Exception:
+                self.dropBroken()
+                continue
+            if parsed is None:
+                continue
+            kind, action = parsed
+            if not self.scheduler.push(kind, (time.perf_counter(), action)):
+                self.stats.count("shed_queue_" + kind)
+
+    def serveQueued(self):
+        # serve stage: one round of queued requests, reads first
+        for kind, (queued, action) in self.scheduler.take(self.servePerRound):
+            self.stats.observe("wait_" + kind, time.perf_counter() - queued)
+            try:
+                action()
+            except IOError:
+                pass
+            except Exception:
+                self.dropBroken()
+
+    def dropBroken(self):
+        # a request that raised is dropped, one bad datagram mustn't take
+        #   the device offline
+        self.stats.count("dropped")
+        logger.debug("dropped a request that raised", exc_info=True)
+
+    def receive(self):
+        # recvfrom plus the kernel's arrival timestamp where the OS has one
+        if SO_TIMESTAMPNS is not None:
+            msg, ancdata, flags, addr = self.serverSocket.recvmsg(MAX_DATAGRAM, socket.CMSG_SPACE(16))
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                    sec, nsec = struct.unpack("qq", data[:16])
+                    return msg, addr, sec + nsec * 1e-9
+            return msg, addr, None
+        msg, addr = self.serverSocket.recvfrom(MAX_DATAGRAM)
+        return msg, addr, None
+
+    def run(self):  # the running function
+        if self.useAsyncio:
+            import asyncio
+            asyncio.run(self.serve())
+            return
+        nextTick = time.monotonic()
+        while True:
+            self.drain()
+            self.serveQueued()
+            now = time.monotonic()
+            if now >= nextTick:
+                self.tick()
+                nextTick = now + self.updatePeriod
+            if not len(self.scheduler):
+                # sleep until the next tick or the next datagram
+                select.select([self.serverSocket], [], [], max(0.0, nextTick - time.monotonic()))
+
+    async def serve(self):
+        # Event driven mode: datagrams are answered as soon as they arrive, in
+        # arrival order without the priority queues, and the temperature is
+        # refreshed by its own periodic task.
+        import asyncio
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: ThermometerProtocol(self), sock=self.serverSocket)
+        try:
+            while True:
+                self.tick()
+                await asyncio.sleep(self.updatePeriod)
+        finally:
+            transport.close()
+            self.transport = None
+
+
+class ThermometerProtocol:
+    # asyncio.DatagramProtocol's interface, written out so this module
+    #   doesn't need asyncio unless useAsyncio is set
+    def __init__(self, thermometer):
+        self.thermometer = thermometer
+
+    def connection_made(self, transport):
+        self.thermometer.transport = transport
+
+    def datagram_received(self, data, addr):
+        # answered straight away, so there is no queue wait to measure here
+        self.thermometer.handleDatagram(data, addr)
+
+    def error_received(self, exc):
+        pass
+
+    def connection_lost(self, exc):
+        self.thermometer.transport = None
@@ -0,0 +1,98 @@
+import collections
+import secrets
+import time
+
+
+class TokenStore:
+    """Session tokens for SmartNetworkThermometer.
+
+    Tokens are kept in an OrderedDict ordered from least to most recently used,
+    so lookup, logout and eviction are all O(1). A token stops being valid
+    once it is older than ttl seconds or has not been used for idleTimeout
+    seconds (None disables either check). When maxSize tokens are live the
+    least recently used one is evicted to make room for a new login. Each
+    token can carry a piece of session data that goes away with it.
+    """
+
+    def __init__(self, maxSize=1000, ttl=None, idleTimeout=3600, clock=time.monotonic):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.idleTimeout = idleTimeout
+        self.clock = clock
+        self.tokens = collections.OrderedDict()  # token -> [issued, lastUsed, data]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.issued = 0
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return self.validate(token)
+
+    def isExpired(self, times, now):
+        issued, lastUsed = times[0], times[1]
+        if self.ttl is not None and now - issued > self.ttl:
+            return True
+        if self.idleTimeout is not None and now - lastUsed > self.idleTimeout:
+            return True
+        return False
+
+    def validate(self, token):
+        # Checks a token and marks it as used
+        times = self.tokens.get(token)
+        if times is None:
+            self.misses += 1
+            return False
+        now = self.clock()
+        if self.isExpired(times, now):
+            del self.tokens[token]
+            self.expirations += 1
+            self.misses += 1
+            return False
+        times[1] = now
+        self.tokens.move_to_end(token)
+        self.hits += 1
+        return True
+
+    def issue(self):
+        now = self.clock()
+        self.purge(now)
+        while len(self.tokens) >= self.maxSize:
+            self.tokens.popitem(last=False)
+            self.evictions += 1
+        token = secrets.token_urlsafe(16)
+        self.tokens[token] = [now, now, None]
+        self.issued += 1
+        return token
+
+    def getData(self, token):
+        times = self.tokens.get(token)
+        return times[2] if times is not None else None
+
+    def setData(self, token, data):
+        times = self.tokens.get(token)
+        if times is not None:
+            times[2] = data
+
+    def remove(self, token):
+        # Returns True if the token was live
+        return self.tokens.pop(token, None) is not None
+
+    def purge(self, now=None):
+        # Drops idle tokens from the least recently used end. Tokens past
+        # their ttl but still in use are dropped when they are next checked.
+        if now is None:
+            now = self.clock()
+        while self.tokens:
+            token, times = next(iter(self.tokens.items()))
+            if not self.isExpired(times, now):
+                break
+            del self.tokens[token]
+            self.expirations += 1
+
+    def getStats(self):
+        return {"active": len(self.tokens), "issued": self.issued, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations}